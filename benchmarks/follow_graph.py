@@ -0,0 +1,89 @@
+"""Memory and latency of the follower graph index on a synthetic graph.
+
+Run from the repository root:
+
+	python benchmarks/follow_graph.py [--users 100000] [--edges 1000000] [--queries 1000]
+
+Followed accounts are drawn from a skewed distribution so a few accounts
+collect many followers, as on a real network.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.follow_graph import FollowGraph
+
+def synthetic_edges(user_ids: list[str], edge_count: int, seed: int):
+	rng = random.Random(seed)
+	count = len(user_ids)
+	seen = set()
+	while len(seen) < edge_count:
+		follower = rng.randrange(count)
+		# paretovariate skews followed accounts towards low indexes
+		followed = min(int(rng.paretovariate(1.2)) - 1, count - 1)
+		followed = (followed * 7919 + rng.randrange(8)) % count
+		if follower == followed or (follower, followed) in seen:
+			continue
+		seen.add((follower, followed))
+	for follower, followed in seen:
+		yield user_ids[follower], user_ids[followed]
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--users", type=int, default=100_000)
+	parser.add_argument("--edges", type=int, default=1_000_000)
+	parser.add_argument("--queries", type=int, default=1000)
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	user_ids = [str(uuid.UUID(int=random.Random(args.seed + i).getrandbits(128))) for i in range(args.users)]
+	edges = list(synthetic_edges(user_ids, args.edges, args.seed))
+
+	graph = FollowGraph()
+	started = time.perf_counter()
+	graph.build(iter(edges))
+	build_seconds = time.perf_counter() - started
+
+	# Build a second time under tracemalloc, which slows it down too much to time
+	tracemalloc.start()
+	measured = FollowGraph()
+	measured.build(iter(edges))
+	index_bytes, peak_bytes = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del edges, measured
+
+	csr_bytes = sum(
+		csr.offsets.itemsize * len(csr.offsets) + csr.targets.itemsize * len(csr.targets)
+		for csr in (graph._following, graph._followers)
+	)
+	print(f"graph: users={args.users} edges={graph.edge_count}")
+	print(f"build: {build_seconds:.2f}s, index={index_bytes / 2**20:.1f}MiB "
+		f"(CSR arrays {csr_bytes / 2**20:.1f}MiB, rest is the UUID map), peak={peak_bytes / 2**20:.1f}MiB")
+
+	rng = random.Random(args.seed)
+	timings = []
+	for _ in range(args.queries):
+		user_id = user_ids[rng.randrange(args.users)]
+		started = time.perf_counter()
+		graph.suggestions(user_id, limit=10)
+		timings.append(time.perf_counter() - started)
+	timings.sort()
+	print(f"suggestions: queries={len(timings)} "
+		f"p50={statistics.median(timings) * 1000:.2f}ms "
+		f"p99={timings[int(len(timings) * 0.99) - 1] * 1000:.2f}ms "
+		f"max={timings[-1] * 1000:.2f}ms")
+
+	started = time.perf_counter()
+	for _ in range(10000):
+		graph.add_edge(user_ids[rng.randrange(args.users)], user_ids[rng.randrange(args.users)])
+	print(f"incremental follow: {(time.perf_counter() - started) / 10000 * 1e6:.1f}us per edge")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,69 @@
+"""Measure how long a fresh interpreter takes to import the app.
+
+Run from the repository root:
+
+	python benchmarks/startup.py [--runs 10] [--importtime]
+
+Each run imports `main` in a new process so module caches do not carry over.
+With --importtime the slowest modules from `python -X importtime` are listed.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMED_IMPORT = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+def time_import(runs: int):
+	timings = []
+	for _ in range(runs):
+		result = subprocess.run(
+			[sys.executable, "-c", TIMED_IMPORT],
+			cwd=ROOT,
+			capture_output=True,
+			text=True,
+			check=True
+		)
+		timings.append(float(result.stdout.strip().splitlines()[-1]))
+	return timings
+
+def slowest_imports(limit: int = 15):
+	result = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", "import main"],
+		cwd=ROOT,
+		capture_output=True,
+		text=True,
+		check=True
+	)
+	rows = []
+	for line in result.stderr.splitlines():
+		if not line.startswith("import time:") or "self [us]" in line:
+			continue
+		# Format: "import time: <self us> | <cumulative us> | <module>"
+		_, cumulative_us, name = line[len("import time:"):].split("|")
+		rows.append((int(cumulative_us), name.strip()))
+	rows.sort(reverse=True)
+	return rows[:limit]
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--runs", type=int, default=10)
+	parser.add_argument("--importtime", action="store_true", help="list the slowest modules")
+	args = parser.parse_args()
+
+	timings = time_import(args.runs)
+	print(f"import main: runs={len(timings)} "
+		f"min={min(timings) * 1000:.1f}ms "
+		f"median={statistics.median(timings) * 1000:.1f}ms "
+		f"max={max(timings) * 1000:.1f}ms")
+
+	if args.importtime:
+		print("slowest imports (cumulative):")
+		for cumulative_us, name in slowest_imports():
+			print(f"  {cumulative_us / 1000:8.1f}ms  {name}")
+
+if __name__ == "__main__":
+	main()
@@ -1,32 +1,85 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from typing import Optional
-from supabase import create_client
-from utils.cloudinary import upload_image, delete_image
-from dotenv import load_dotenv
+from utils.cloudinary import upload_image, delete_image, delete_images, configure_cloudinary
+from utils.config import get_settings
+from utils.database import get_supabase, get_read_client, mark_write, has_recent_write, warmup_supabase, ReadYourWritesMiddleware
+from utils.feed_cache import feed_snapshot
+from utils.follow_graph import follow_graph
+from utils.known_ids import known_users, known_tweets, check_exists, preload_ids
+from utils.columns import PROFILE_CARD_COLUMNS, TWEET_ROW_COLUMNS, TWEET_COLUMNS, USER_IMAGE_COLUMNS, EXISTENCE_COLUMNS, \
+	LIKED_TWEET_AUTHOR_EMBED, PARENT_AUTHOR_EMBED, NOTIFICATION_COLUMNS
+from utils.tweets import TWEET_FIELDS, hydrate_tweets, apply_viewer_likes
+from utils.users import USER_FIELDS, hydrate_users, fetch_users_in_order
+from utils.fields import parse_fields, select_fields, select_item_fields
+from utils.ingest import MAX_IMPORT_ID_LENGTH, read_lines, parse_row, insert_batch, load_progress, save_progress
+from utils.export import EXPORT_SOURCES, export_user, gzip_stream
+from utils.views import view_counter
+from utils.notifications import notification_queue, hydrate_notifications, encode_cursor, decode_cursor
+from utils.profiling import ProfilingMiddleware
+from utils.resilience import BackendUnavailable, StaleResponseMiddleware
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from uuid import UUID
 
-from models.User import UserBase, UserCreate, UserResponse, UserAccess, UserFollowerResponse, SignInRequest
+from models.User import UserCreate, UserResponse, UserSuggestionResponse, UserAccess, UserFollowerResponse, SignInRequest
 from models.Tweet import TweetResponse, TweetUserResponse
-import os
+import asyncio
+import logging
 import jwt
+import math
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
+# Open backend connections and prime caches ahead of traffic
+def warmup():
+	warmup_supabase()
+	configure_cloudinary()
+	supabase = get_read_client()
+	preload_ids(supabase, "users", known_users)
+	preload_ids(supabase, "tweets", known_tweets)
 
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
-
-ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-app = FastAPI()
+async def run_warmup(app: FastAPI, prime_feed: bool):
+	try:
+		await run_in_threadpool(warmup)
+		if prime_feed:
+			await asyncio.wait_for(feed_snapshot.primed.wait(), timeout=30)
+	except Exception:
+		logger.exception("Warmup failed, continuing with cold connections")
+	finally:
+		app.state.ready = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	settings = get_settings()
+	app.state.ready = not settings.warmup
+	tasks = []
+	if settings.feed_snapshot_size > 0:
+		feed_snapshot.configure(settings.feed_snapshot_size, settings.feed_snapshot_interval)
+		tasks.append(asyncio.create_task(feed_snapshot.run()))
+	if settings.follow_graph:
+		tasks.append(asyncio.create_task(follow_graph.run(settings.follow_graph_interval)))
+	if settings.notifications:
+		notification_queue.configure(settings.notification_batch_size, settings.notification_interval, settings.notification_max_pending)
+		tasks.append(asyncio.create_task(notification_queue.run()))
+	if settings.view_counts:
+		view_counter.configure(settings.view_flush_interval, settings.view_buffer_size)
+		tasks.append(asyncio.create_task(view_counter.run()))
+	if settings.warmup:
+		tasks.append(asyncio.create_task(run_warmup(app, prime_feed=settings.feed_snapshot_size > 0)))
+	yield
+	for task in tasks:
+		task.cancel()
+	# Write the notifications and views still buffered
+	if settings.notifications:
+		await run_in_threadpool(notification_queue.flush)
+	if settings.view_counts:
+		await run_in_threadpool(view_counter.flush)
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
 	"*"
@@ -40,6 +93,16 @@ app.add_middleware(
 	allow_headers=["*"]
 )
 
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(StaleResponseMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+
+# A backend timed out (504) or its circuit breaker is open (503)
+@app.exception_handler(BackendUnavailable)
+async def backend_unavailable(request: Request, exc: BackendUnavailable):
+	headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after else None
+	return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)}, headers=headers)
+
 # Password hashing context using bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -50,18 +113,27 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 	return pwd_context.verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
+	settings = get_settings()
 	to_encode = data.copy()
 	if expires_delta:
 		expire = datetime.now() + expires_delta
 	else:
-		expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+		expire = datetime.now() + timedelta(minutes=int(settings.access_token_expire_minutes))
 	to_encode.update({"exp": expire})
 
-	encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+	encoded_jwt = jwt.encode(to_encode, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
 	return encoded_jwt
 
+# Readiness probe for the load balancer, fails until warmup has finished
+@app.get("/ready")
+async def ready(request: Request):
+	if not request.app.state.ready:
+		raise HTTPException(status_code=503, detail="Warming up")
+	return {"status": "ready"}
+
 @app.post("/signup")
 async def sign_up(request: UserCreate):
+	supabase = get_supabase()
 	try:
 		# Hash the password before sending it to Supabase (if you're using a custom DB, not Supabase auth)
 		hashed_password = hash_password(request.password)
@@ -92,7 +164,9 @@ async def sign_up(request: UserCreate):
 			"role_id": "d380cc38-cd59-4e4a-8f5d-4a6afec84fca"
 		}
 
-		insert_response = supabase.table('users').insert(user_data).execute()
+		insert_response = supabase.table('users').insert(user_data, returning="minimal").execute()
+		mark_write(user_id)
+		known_users.add(user_id)
 
 		
 		if not insert_response:
@@ -100,11 +174,14 @@ async def sign_up(request: UserCreate):
 		
 		return {"message": "Sign-up successful!"}
 
+	except BackendUnavailable:
+		raise
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/signin")
 async def sign_in(request: SignInRequest):
+	supabase = get_supabase()
 	try:
 		# Directly check the password using Supabase Auth (it manages password hashing)
 		response = supabase.auth.sign_in_with_password({
@@ -115,35 +192,42 @@ async def sign_in(request: SignInRequest):
 		if not response:
 			raise HTTPException(status_code=400, detail=response["error"]["message"])
 		
-		user_data = supabase.table("users").select("*").eq("id", response.user.id).execute()
+		user_data = supabase.table("users").select(EXISTENCE_COLUMNS).eq("id", response.user.id).execute()
 
 		#Generate JWT token
-		access_token_expires = timedelta(minutes=int(ACCESS_TOKEN_EXPIRE_MINUTES))
+		access_token_expires = timedelta(minutes=int(get_settings().access_token_expire_minutes))
 		access_token = create_access_token(
 			data={"sub": user_data.data[0]["id"]},
 			expires_delta=access_token_expires
 		)
 
 		return {"message": "Sign-in successful!", "token": access_token}
+	except BackendUnavailable:
+		raise
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/signout")
 async def sign_out():
+	supabase = get_supabase()
 	try:
 		supabase.auth.sign_out()
 
 		return {"message": "Successfully signed out!"}
+	except BackendUnavailable:
+		raise
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/users")
-async def get_users(user_id: Optional[str] = None, page: int = 1, page_size: int = 10):
+async def get_users(user_id: Optional[str] = None, page: int = 1, page_size: int = 10, fields: Optional[str] = None):
+	selected = parse_fields(fields, USER_FIELDS)
+	supabase = get_read_client(user_id)
 	offset = (page - 1) * page_size
 
 	response = supabase \
 		.from_("users") \
-		.select("*") \
+		.select(PROFILE_CARD_COLUMNS) \
 		.order("created_at", desc=True) \
 		.range(offset, offset + page_size - 1) \
 		.execute()
@@ -151,82 +235,27 @@ async def get_users(user_id: Optional[str] = None, page: int = 1, page_size: int
 	if not response.data:
 		raise HTTPException(status_code=400, detail="Error fetching users")
 	
-	users = []
-	for user in response.data:
-		tweet_count_response = supabase.from_("tweets").select("*", count= "exact").eq("user_id", user["id"]).execute()
-		tweet_count = tweet_count_response.count
-
-		follower_count_response = supabase.from_("user_followers").select("*", count="exact").eq("user_id", user["id"]).execute()
-		follower_count = follower_count_response.count
-
-		following_count_response = supabase.from_("user_followers").select("*", count="exact").eq("follower_id", user["id"]).execute()
-		following_count = following_count_response.count
-
-		is_followed = None
-		if user_id:
-			is_followed_response = supabase \
-				.from_("user_followers") \
-				.select("id") \
-				.eq("follower_id", user_id) \
-				.eq("user_id", user["id"]) \
-				.execute()
-				
-			is_followed = bool(is_followed_response.data)
-
-		user_data = UserResponse(
-			id=user["id"],
-			email=user["email"],
-			username=user["username"],
-			bio=user["bio"],
-			profile_image_url=user["profile_image_url"],
-			background_image_url=user["background_image_url"],
-			created_at=user["created_at"],
-			tweet_count=tweet_count,
-			follower_count=follower_count,
-			following_count=following_count,
-			is_followed=is_followed
-		)
-		users.append(user_data)
-	return {"data": users, "page": page, "page_size": page_size}
+	users = hydrate_users(supabase, response.data, viewer_id=user_id, fields=selected)
+	return {"data": select_fields(users, selected, USER_FIELDS), "page": page, "page_size": page_size}
 
 # Get user
 @app.post("/user", response_model=UserResponse)
-async def get_user(request: UserAccess):
+async def get_user(request: UserAccess, fields: Optional[str] = None):
+	selected = parse_fields(fields, USER_FIELDS)
 	try:
-		payload = jwt.decode(request.access_token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+		settings = get_settings()
+		payload = jwt.decode(request.access_token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
 		user_id = payload.get("sub")
+		supabase = get_read_client(user_id)
 		
-		response = supabase.table("users").select("*").eq("id", user_id).execute()
+		response = supabase.table("users").select(PROFILE_CARD_COLUMNS).eq("id", user_id).execute()
 		user = response.data
 
 		if not user:
 			raise HTTPException(status_code=400, detail="User not found!")
 		
-		 # Fetch tweet count for the user
-		tweet_count_response = supabase.from_("tweets").select("*", count= "exact").eq("user_id", user_id).execute()
-		tweet_count = tweet_count_response.count
-
-		# Fetch followers count for the user
-		follower_count_response = supabase.from_("user_followers").select("*", count="exact").eq("user_id", user_id).execute()
-		follower_count = follower_count_response.count
-
-		# Fetch following count for the user
-		following_count_response = supabase.from_("user_followers").select("*", count="exact").eq("follower_id", user_id).execute()
-		following_count = following_count_response.count
-		
-		user_data = UserResponse(
-			id=user[0]["id"],
-			email=user[0]["email"],
-			username=user[0]["username"],
-			bio=user[0]["bio"],
-			profile_image_url=user[0]["profile_image_url"],
-			background_image_url=user[0]["background_image_url"],
-			created_at=user[0]["created_at"],
-			tweet_count=tweet_count,
-			follower_count=follower_count,
-			following_count=following_count
-		)
-		return user_data
+		user_data = hydrate_users(supabase, user, fields=selected)[0]
+		return select_item_fields(user_data, selected, USER_FIELDS)
 	except jwt.ExpiredSignatureError:
 		raise HTTPException(status_code=401, detail="Token has expired")
 	except jwt.PyJWTError:
@@ -234,171 +263,121 @@ async def get_user(request: UserAccess):
 
 # Get user by id
 @app.get("/user/{user_id}", response_model=UserResponse)
-async def get_user_by_id(user_id: str, follower_id: Optional[str] = None):
-	response = supabase.table("users").select("*").eq("id", user_id).execute()
+async def get_user_by_id(user_id: str, follower_id: Optional[str] = None, fields: Optional[str] = None):
+	selected = parse_fields(fields, USER_FIELDS)
+	if known_users.lookup(user_id) is False:
+		raise HTTPException(status_code=404, detail="User not found!")
+
+	supabase = get_read_client(user_id, follower_id)
+	response = supabase.table("users").select(PROFILE_CARD_COLUMNS).eq("id", user_id).execute()
 	user = response.data
+	known_users.record(user_id, bool(user))
 
 	if not user:
 		raise HTTPException(status_code=404, detail="User not found!")
-		
-	# Fetch tweet count for the user
-	tweet_count_response = supabase.from_("tweets").select("*", count= "exact").eq("user_id", user_id).execute()
-	tweet_count = tweet_count_response.count
 
-	# Fetch followers count for the user
-	follower_count_response = supabase.from_("user_followers").select("*", count="exact").eq("user_id", user_id).execute()
-	follower_count = follower_count_response.count
-		
-	# Fetch following count for the user
-	following_count_response = supabase.from_("user_followers").select("*", count="exact").eq("follower_id", user_id).execute()
-	following_count = following_count_response.count
-
-	is_followed = None
-	if follower_id:
-		is_followed_response = supabase \
-			.from_("user_followers") \
-			.select("id") \
-			.eq("follower_id", follower_id) \
-			.eq("user_id", user_id) \
-			.execute()
-				
-		is_followed = bool(is_followed_response.data)
-
-	user_data = UserResponse(
-		id=user[0]["id"],
-		email=user[0]["email"],
-		username=user[0]["username"],
-		bio=user[0]["bio"],
-		profile_image_url=user[0]["profile_image_url"],
-		background_image_url=user[0]["background_image_url"],
-		created_at=user[0]["created_at"],
-		tweet_count=tweet_count,
-		follower_count=follower_count,
-		following_count=following_count,
-		is_followed=is_followed
-	)
-	return user_data
+	user_data = hydrate_users(supabase, user, viewer_id=follower_id, fields=selected)[0]
+	return select_item_fields(user_data, selected, USER_FIELDS)
 
 # Get all tweets of user by user id
 @app.get("/user/{user_id}/tweets")
-async def get_tweets_by_user_id(user_id: str, page: Optional[int] = 1, page_size: Optional[int] = 10):
-	existing_user_response = supabase \
-		.table("users") \
-		.select("*") \
-		.eq("id", user_id) \
-		.execute()
-	
-	if not existing_user_response.data:
+async def get_tweets_by_user_id(user_id: str, page: Optional[int] = 1, page_size: Optional[int] = 10, fields: Optional[str] = None):
+	selected = parse_fields(fields, TWEET_FIELDS)
+	if known_users.lookup(user_id) is False:
 		raise HTTPException(status_code=404, detail="User not found!")
+
+	supabase = get_read_client(user_id)
 	
 	# Calculate offset
 	offset = (page - 1) * page_size
 	
 	user_tweets_response = supabase \
 		.from_("tweets") \
-		.select("id, content, user_id, retweet_id, image_url, created_at, users(id, username, email, profile_image_url)") \
+		.select(TWEET_COLUMNS) \
 		.eq("user_id", user_id) \
 		.order("created_at", desc=True) \
 		.range(offset, offset + page_size - 1) \
 		.execute()
 	
+	# Tweets prove the user exists, only an empty page needs the check
 	if not user_tweets_response.data:
+		if not check_exists(supabase, "users", known_users, user_id):
+			raise HTTPException(status_code=404, detail="User not found!")
 		return {"data": [], "page": page, "page_size": page_size, "tweet_count": 0}
+	known_users.add(user_id)
 	
-	tweets = []
-	for tweet in user_tweets_response.data:
-		# Count the number of users who liked this tweet
-		likes_count_response = supabase \
-			.from_("tweet_likes") \
-			.select("id") \
-			.eq("tweet_id", tweet["id"]) \
-			.execute()
-		
-		likes_count = len(likes_count_response.data)
-
-		# Count the number of retweets for this tweet
-		retweet_count_response = supabase \
-			.from_("tweets") \
-			.select("id") \
-			.eq("retweet_id", tweet["id"]) \
-			.execute()
-
-		retweet_count = len(retweet_count_response.data)  # Get the count of retweets
-
-		reply_to = None
-		if tweet["retweet_id"]:
-			reply_to_response = supabase \
-				.from_("tweets") \
-				.select("users(email)") \
-				.eq("id", tweet["retweet_id"]) \
-				.execute()
-		
-			if reply_to_response.data:
-				reply_to = reply_to_response.data[0]["users"]["email"]
-
-		is_liked = False
+	tweets = hydrate_tweets(supabase, user_tweets_response.data, fields=selected)
+	tweets = apply_viewer_likes(supabase, tweets, user_id, fields=selected)
+	view_counter.record(*(tweet.id for tweet in tweets))
+	return  {"data": select_fields(tweets, selected, TWEET_FIELDS), "page": 1, "page_size": page_size, "tweet_count": len(tweets)}
+
+# Get who-to-follow suggestions for user
+@app.get("/user/{user_id}/suggestions")
+async def get_user_suggestions(user_id: str, limit: int = 10):
+	if not follow_graph.loaded:
+		raise HTTPException(status_code=503, detail="Suggestions are not available yet")
+
+	# CPU bound, kept off the event loop
+	suggestions = await run_in_threadpool(follow_graph.suggestions, user_id, limit=max(1, min(limit, 50)))
+	if not suggestions:
+		return {"data": [], "count": 0}
+
+	supabase = get_read_client(user_id)
+	users_response = supabase \
+		.table("users") \
+		.select(PROFILE_CARD_COLUMNS) \
+		.in_("id", [suggestion["user_id"] for suggestion in suggestions]) \
+		.execute()
+	users_by_id = {user["id"]: user for user in users_response.data}
 
-		if user_id:
-			is_liked_response = supabase \
-				.from_("tweet_likes") \
-				.select("id") \
-				.eq("tweet_id", tweet["id"]) \
-				.eq("user_id", user_id) \
-				.execute()
-			
-			is_liked = bool(is_liked_response.data)
-
-		# Get the user data for this tweet
-		user = tweet["users"]
-		tweet_data = TweetResponse(
-			id=tweet["id"],
-			content=tweet["content"],
-			user_id=tweet["user_id"],
-			retweet_id=tweet.get("retweet_id"),
-			image_url=tweet.get("image_url"),
-			created_at=tweet["created_at"],
-			user=UserBase(
-				id=user["id"], 
-				username=user["username"], 
-				email=user["email"], 
-				profile_image_url=user['profile_image_url']
-			),
-			retweet_count=retweet_count,
-			likes_count=likes_count,
-			is_liked=is_liked,
-			reply_to=reply_to
-		)
-		tweets.append(tweet_data)
-	return  {"data": tweets, "page": 1, "page_size": page_size, "tweet_count": len(tweets)}
+	data = []
+	for suggestion in suggestions:
+		user = users_by_id.get(suggestion["user_id"])
+		if not user:
+			continue
+		data.append(UserSuggestionResponse(
+			id=user["id"],
+			email=user["email"],
+			username=user["username"],
+			bio=user["bio"],
+			profile_image_url=user["profile_image_url"],
+			background_image_url=user["background_image_url"],
+			created_at=user["created_at"],
+			score=suggestion["score"],
+			mutual_count=suggestion["mutual_count"],
+			follows_you=suggestion["follows_you"]
+		))
+	return {"data": data, "count": len(data)}
 
 # Toggle follow user
 @app.post("/user/{user_id}")
 async def toggle_follow_user(user_id: str, request: UserFollowerResponse):
-	# Check if follower already follow the user
-	existing_follow = supabase \
-		.table("user_followers") \
-		.select("*") \
+	if known_users.lookup(user_id) is False:
+		raise HTTPException(status_code=404, detail="User not found")
+
+	supabase = get_supabase()
+	mark_write(request.follower_id)
+	# Un-follow, the delete doubles as the check whether the follower already follows the user
+	response = supabase.table("user_followers") \
+		.delete() \
 		.eq("user_id", user_id) \
 		.eq("follower_id", request.follower_id) \
+		.select(EXISTENCE_COLUMNS) \
 		.execute()
-	# If yes, then un-follow
-	if existing_follow.data:
-		response = supabase.table("user_followers") \
-			.delete() \
-			.eq("user_id", user_id) \
-			.eq("follower_id", request.follower_id) \
-			.execute()
-		if not response.data:
-			raise HTTPException(status_code=500, detail="Failed to un-follow the user")
+	if response.data:
+		follow_graph.remove_edge(request.follower_id, user_id)
 		return {"message": "Un-follow user successfully!"}
 	# If not, then follow user
 	else:
 		response = supabase \
 		.table("user_followers") \
 		.insert({"user_id": user_id, "follower_id": str(request.follower_id)}) \
+		.select(EXISTENCE_COLUMNS) \
 		.execute()
 		if not response.data:
 			raise HTTPException(status_code=500, detail="Failed to follow the user")
+		follow_graph.add_edge(request.follower_id, user_id)
+		notification_queue.notify("follow", user_id, request.follower_id)
 		return {"message": "Follow user successfully!"}
 
 # Update user
@@ -408,6 +387,11 @@ async def update_user(user_id: str,
 	bio: Optional[str] = Form(None),
 	profile_image: Optional[UploadFile] = File(None),
 	background_image: Optional[UploadFile] = File(None)):
+	# Don't upload images for a user known to be missing
+	if known_users.lookup(user_id) is False:
+		raise HTTPException(status_code=404, detail="User not found")
+
+	supabase = get_supabase()
 
 	profile_image_url = None
 	background_image_url = None
@@ -420,12 +404,15 @@ async def update_user(user_id: str,
 	if background_image:
 		background_image_url = upload_image(background_image.file, folder="background_images")
 
-	# Fetch the existing user data from the database
-	response = supabase.table("users").select("*").eq("id", user_id).execute()
-	if not response.data:
-		raise HTTPException(status_code=404, detail="User not found")
-	
-	user_data = response.data[0]
+	# Fetch the current image urls, only needed to delete replaced images.
+	# Without new images the update itself tells whether the user exists.
+	user_data = {}
+	if profile_image or background_image:
+		response = supabase.table("users").select(USER_IMAGE_COLUMNS).eq("id", user_id).execute()
+		known_users.record(user_id, bool(response.data))
+		if not response.data:
+			raise HTTPException(status_code=404, detail="User not found")
+		user_data = response.data[0]
 	
 	# Prepare the data to update the user
 	user_update_data = {
@@ -436,6 +423,8 @@ async def update_user(user_id: str,
 	if profile_image and user_data["profile_image_url"]:
 		try:
 			delete_image(user_data["profile_image_url"])
+		except BackendUnavailable:
+			raise
 		except:
 			raise HTTPException(status_code=500, detail="Failed to delete the profile image")
 
@@ -444,6 +433,8 @@ async def update_user(user_id: str,
 	if background_image and user_data["background_image_url"]:
 		try:
 			delete_image(user_data["background_image_url"])
+		except BackendUnavailable:
+			raise
 		except:
 			raise HTTPException(status_code=500, detail="Failed to delete the background image")
 
@@ -456,275 +447,212 @@ async def update_user(user_id: str,
 		user_update_data["background_image_url"] = background_image_url
 
 	# Update the user record in the database
-	update_response = supabase.table("users").update(user_update_data).eq("id", user_id).execute()
+	update_response = supabase.table("users").update(user_update_data).eq("id", user_id).select(PROFILE_CARD_COLUMNS).execute()
+	mark_write(user_id)
 	
 	# Check if the update was successful
 	if not update_response.data:
+		if not user_data:
+			known_users.mark_missing(user_id)
+			raise HTTPException(status_code=404, detail="User not found")
 		raise HTTPException(status_code=500, detail="Failed to update user")
+	known_users.add(user_id)
 
 	return {"message": "User updated successfully", "data": update_response.data}
 
 # Get all followers of user by user id
 @app.get("/user/{user_id}/followers")
-async def get_user_followers(user_id: str, page: int = 1, page_size: int = 10):
+async def get_user_followers(user_id: str, page: int = 1, page_size: int = 10, fields: Optional[str] = None):
+	selected = parse_fields(fields, USER_FIELDS)
+	if known_users.lookup(user_id) is False:
+		raise HTTPException(status_code=404, detail="User not found")
+
+	supabase = get_read_client(user_id)
 	offset = (page - 1) * page_size
 
-	existing_user_response = supabase \
-		.table("users") \
-		.select("*") \
-		.eq("id", user_id) \
-		.execute()
-	
-	if not existing_user_response.data:
-		raise HTTPException(status_code=404, detail="User not found")
-	
 	user_followers_response = supabase \
 		.from_("user_followers") \
 		.select("follower_id") \
 		.eq("user_id", user_id) \
+		.order("follower_id") \
+		.range(offset, offset + page_size - 1) \
 		.execute()
 	
+	# Edges prove the user exists, only an empty page needs the check
 	if not user_followers_response.data:
+		if not check_exists(supabase, "users", known_users, user_id):
+			raise HTTPException(status_code=404, detail="User not found")
 		return {"data": [], "page": page, "page_size": page_size, "count": 0}
+	known_users.add(user_id)
 	
-	followers = []
-
-	for response in user_followers_response.data:
-		follower_response = supabase \
-			.table("users") \
-			.select("*") \
-			.eq("id", response["follower_id"]) \
-			.range(offset, offset + page_size - 1) \
-			.execute()
-		if not follower_response.data:
-			raise HTTPException(status_code=500, detail="Failed while fetching follower")
-		follower_data=follower_response.data
-		data = UserResponse(
-			id=follower_data[0]["id"],
-			email=follower_data[0]["email"],
-			username=follower_data[0]["username"],
-			bio=follower_data[0]["bio"],
-			profile_image_url=follower_data[0]["profile_image_url"],
-			background_image_url=follower_data[0]["background_image_url"],
-			created_at=follower_data[0]["created_at"],
-		)
-		followers.append(data)
-	return {"data": followers, "page": page, "page_size": page_size, "count": len(followers)}
+	followers = fetch_users_in_order(supabase, [response["follower_id"] for response in user_followers_response.data], selected)
+	return {"data": select_fields(followers, selected, USER_FIELDS), "page": page, "page_size": page_size, "count": len(followers)}
 
 # Get all following of user by user id
 @app.get("/user/{user_id}/followings")
-async def get_user_following(user_id: str, page: int = 1, page_size: int = 10):
+async def get_user_following(user_id: str, page: int = 1, page_size: int = 10, fields: Optional[str] = None):
+	selected = parse_fields(fields, USER_FIELDS)
+	if known_users.lookup(user_id) is False:
+		raise HTTPException(status_code=404, detail="User not found")
+
+	supabase = get_read_client(user_id)
 	offset = (page - 1) * page_size
 
-	existing_user_response = supabase \
-		.table("users") \
-		.select("*") \
-		.eq("id", user_id) \
-		.execute()
-	
-	if not existing_user_response.data:
-		raise HTTPException(status_code=404, detail="User not found")
-	
 	user_following_response = supabase \
 		.from_("user_followers") \
 		.select("user_id") \
 		.eq("follower_id", user_id) \
+		.order("user_id") \
+		.range(offset, offset + page_size - 1) \
 		.execute()
 	
+	# Edges prove the user exists, only an empty page needs the check
 	if not user_following_response.data:
+		if not check_exists(supabase, "users", known_users, user_id):
+			raise HTTPException(status_code=404, detail="User not found")
 		return {"data": [], "page": page, "page_size": page_size, "count": 0}
+	known_users.add(user_id)
 	
-	followings = []
+	followings = fetch_users_in_order(supabase, [response["user_id"] for response in user_following_response.data], selected)
+	return {"data": select_fields(followings, selected, USER_FIELDS), "page": page, "page_size": page_size, "count": len(followings)}
+
+# Export tweets, likes and follow edges of user as NDJSON, streamed in
+# chunks. `types` limits the export to some of the record types, `since` to
+# the records created since then, `gzip` compresses the stream.
+@app.get("/user/{user_id}/export")
+async def export_user_data(user_id: str, types: Optional[str] = None, since: Optional[datetime] = None, gzip: bool = False, chunk_size: int = 1000):
+	selected = list(EXPORT_SOURCES)
+	if types is not None:
+		selected = [type.strip() for type in types.split(",") if type.strip()]
+		unknown = sorted(set(selected) - set(EXPORT_SOURCES))
+		if unknown:
+			raise HTTPException(status_code=400, detail=f"Unknown types: {', '.join(unknown)}. Allowed: {', '.join(EXPORT_SOURCES)}")
+
+	supabase = get_read_client(user_id)
+	# Checked before the response starts, a 404 can't be sent mid-stream
+	if not check_exists(supabase, "users", known_users, user_id):
+		raise HTTPException(status_code=404, detail="User not found")
 
-	for response in user_following_response.data:
-		follower_response = supabase \
-			.table("users") \
-			.select("*") \
-			.eq("id", response["user_id"]) \
-			.range(offset, offset + page_size - 1) \
-			.execute()
-		if not follower_response.data:
-			raise HTTPException(status_code=500, detail="Failed while fetching follower")
-		following_data=follower_response.data
-		data = UserResponse(
-			id=following_data[0]["id"],
-			email=following_data[0]["email"],
-			username=following_data[0]["username"],
-			bio=following_data[0]["bio"],
-			profile_image_url=following_data[0]["profile_image_url"],
-			background_image_url=following_data[0]["background_image_url"],
-			created_at=following_data[0]["created_at"],
-		)
-		followings.append(data)
-	return {"data": followings, "page": page, "page_size": page_size, "count": len(followings)}
+	# Starlette iterates the generator in the threadpool, a chunk at a time
+	blocks = export_user(supabase, user_id, selected, since.isoformat() if since else None, max(100, min(chunk_size, 5000)))
+	headers = {"Content-Disposition": f'attachment; filename="{user_id}.ndjson"'}
+	if gzip:
+		blocks = gzip_stream(blocks)
+		headers["Content-Encoding"] = "gzip"
+	return StreamingResponse(blocks, media_type="application/x-ndjson", headers=headers)
 
 # Get all tweets
 @app.get("/tweets")
-async def get_tweets(user_id: Optional[str] = None, page: int = 1, page_size: int = 10, no_retweets: Optional[bool] = False):
-	# Fetch all tweets along with user details
+async def get_tweets(user_id: Optional[str] = None, page: int = 1, page_size: int = 10, no_retweets: Optional[bool] = False, fields: Optional[str] = None):
+	selected = parse_fields(fields, TWEET_FIELDS)
+	supabase = get_read_client(user_id)
 	offset = (page - 1) * page_size
 
-	query = supabase \
-		.from_("tweets") \
-		.select("id, content, user_id, retweet_id, image_url, created_at, users(id, username, email, profile_image_url)") \
-		.order("created_at", desc=True) \
-		.range(offset, offset + page_size - 1) \
+	# Serve the first pages from the shared snapshot when it covers them,
+	# unless the viewer just wrote and must see their own change
+	tweets = None
+	if not has_recent_write(user_id):
+		tweets = feed_snapshot.get(bool(no_retweets), offset, page_size)
+
+	if tweets is None:
+		# Fetch all tweets along with user details
+		query = supabase \
+			.from_("tweets") \
+			.select(TWEET_COLUMNS) \
+			.order("created_at", desc=True) \
+			.range(offset, offset + page_size - 1) \
+			
+		if no_retweets is True:
+			query = query.is_("retweet_id", None)
 		
-	if no_retweets is True:
-		query = query.is_("retweet_id", None)
-	
-	tweets_data = query.execute()
+		tweets_data = query.execute()
+		tweets = hydrate_tweets(supabase, tweets_data.data, fields=selected)
 
-	if not tweets_data.data:
+	if not tweets:
 		return {"data": [], "page": page, "page_size": page_size, "tweet_count": 0}
 
-	tweets = []
-	for tweet in tweets_data.data:
-		# Count the number of users who liked this tweet
-		likes_count_response = supabase \
-			.from_("tweet_likes") \
-			.select("id") \
-			.eq("tweet_id", tweet["id"]) \
-			.execute()
-		
-		likes_count = len(likes_count_response.data)
+	tweets = apply_viewer_likes(supabase, tweets, user_id, fields=selected)
+	view_counter.record(*(tweet.id for tweet in tweets))
 
-		# Count the number of retweets for this tweet
-		retweet_count_response = supabase \
-			.from_("tweets") \
-			.select("id") \
-			.eq("retweet_id", tweet["id"]) \
-			.execute()
+	return {"data": select_fields(tweets, selected, TWEET_FIELDS), "page": page, "page_size": page_size, "tweet_count": len(tweets)}
 
-		retweet_count = len(retweet_count_response.data)  # Get the count of retweets
 
-		reply_to = None
-		if tweet["retweet_id"]:
-			reply_to_response = supabase \
-				.from_("tweets") \
-				.select("users(email)") \
-				.eq("id", tweet["retweet_id"]) \
-				.execute()
-		
-			if reply_to_response.data:
-				reply_to = reply_to_response.data[0]["users"]["email"]
-
-		is_liked = False
+# Most ids accepted by /tweets/batch, keeping the in_() query URL short
+MAX_BATCH_IDS = 250
 
-		if user_id:
-			is_liked_response = supabase \
-				.from_("tweet_likes") \
-				.select("id") \
-				.eq("tweet_id", tweet["id"]) \
-				.eq("user_id", user_id) \
-				.execute()
-			
-			is_liked = bool(is_liked_response.data)
-
-		# Get the user data for this tweet
-		user = tweet["users"]
-		tweet_data = TweetResponse(
-			id=tweet["id"],
-			content=tweet["content"],
-			user_id=tweet["user_id"],
-			retweet_id=tweet.get("retweet_id"),
-			image_url=tweet.get("image_url"),
-			created_at=tweet["created_at"],
-			user=UserBase(
-				id=user["id"], 
-				username=user["username"], 
-				email=user["email"], 
-				profile_image_url=user['profile_image_url']
-			),
-			retweet_count=retweet_count,
-			likes_count=likes_count,
-			is_liked=is_liked,
-			reply_to=reply_to
-		)
-		tweets.append(tweet_data)
+# Get many tweets by ID, in the order of `ids` (comma separated). Ids with no
+# tweet are listed in `missing`. Declared before /tweets/{tweet_id} so "batch"
+# is not taken for a tweet id.
+@app.get("/tweets/batch")
+async def get_tweets_batch(ids: str, user_id: Optional[UUID] = None, fields: Optional[str] = None):
+	selected = parse_fields(fields, TWEET_FIELDS)
+	try:
+		# Normalized as the database returns them, duplicates dropped
+		tweet_ids = list(dict.fromkeys(str(UUID(id.strip())) for id in ids.split(",") if id.strip()))
+	except ValueError:
+		raise HTTPException(status_code=400, detail="ids must be comma separated tweet ids")
+	if not tweet_ids:
+		raise HTTPException(status_code=400, detail="No ids given")
+	if len(tweet_ids) > MAX_BATCH_IDS:
+		raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+
+	rows_by_id = {}
+	lookup_ids = [tweet_id for tweet_id in tweet_ids if known_tweets.lookup(tweet_id) is not False]
+	supabase = get_read_client(user_id)
+	if lookup_ids:
+		response = supabase \
+			.table("tweets") \
+			.select(TWEET_COLUMNS) \
+			.in_("id", lookup_ids) \
+			.execute()
+		rows_by_id = {row["id"]: row for row in response.data}
+		for tweet_id in lookup_ids:
+			known_tweets.record(tweet_id, tweet_id in rows_by_id)
 
-	return {"data": tweets, "page": page, "page_size": page_size, "tweet_count": len(tweets)}
+	rows = [rows_by_id[tweet_id] for tweet_id in tweet_ids if tweet_id in rows_by_id]
+	missing = [tweet_id for tweet_id in tweet_ids if tweet_id not in rows_by_id]
 
+	tweets = hydrate_tweets(supabase, rows, fields=selected)
+	tweets = apply_viewer_likes(supabase, tweets, user_id, fields=selected)
+	view_counter.record(*(tweet.id for tweet in tweets))
+	return {"data": select_fields(tweets, selected, TWEET_FIELDS), "missing": missing}
 
 # Get tweet by ID
 @app.get("/tweets/{tweet_id}", response_model=TweetResponse)
-async def get_tweet_by_id(tweet_id: str, user_id: Optional[UUID] = None):
+async def get_tweet_by_id(tweet_id: str, user_id: Optional[UUID] = None, fields: Optional[str] = None):
+	selected = parse_fields(fields, TWEET_FIELDS)
+	if known_tweets.lookup(tweet_id) is False:
+		raise HTTPException(status_code=404, detail="Tweet not found")
+
+	supabase = get_read_client(user_id)
 	response = supabase \
 	.table("tweets") \
-	.select("id, content, user_id, retweet_id, image_url, created_at, users(id, username, email, profile_image_url)") \
+	.select(TWEET_COLUMNS) \
 	.eq("id", tweet_id) \
 	.execute()
 	tweet= response.data
+	known_tweets.record(tweet_id, bool(tweet))
 	
 	if not tweet:
 		raise HTTPException(status_code=404, detail="Tweet not found")
-	
-	retweet_count_response = supabase \
-		.table("tweets") \
-		.select("id") \
-		.eq("retweet_id", tweet_id) \
-		.execute()
-
-	retweet_count = len(retweet_count_response.data)
-
-	# Count the number of users who liked this tweet
-	likes_count_response = supabase \
-		.from_("tweet_likes") \
-		.select("id") \
-		.eq("tweet_id", tweet_id) \
-		.execute()
-		
-	likes_count = len(likes_count_response.data)
-
-	reply_to = None
-	if tweet[0]["retweet_id"]:
-		reply_to_response = supabase \
-			.from_("tweets") \
-			.select("users(email)") \
-			.eq("id", tweet[0]["retweet_id"]) \
-			.execute()
-		print(reply_to_response.data)
-		if reply_to_response.data:
-			reply_to = reply_to_response.data[0]["users"]["email"]
 
-	is_liked = False
-
-	if user_id:
-		is_liked_response = supabase \
-				.from_("tweet_likes") \
-				.select("id") \
-				.eq("tweet_id", tweet_id) \
-				.eq("user_id", user_id) \
-				.execute()
-				
-		is_liked = bool(is_liked_response.data)
-
-	user = tweet[0]["users"]
-	tweet_data = TweetResponse(
-			id=tweet[0]["id"],
-			content=tweet[0]["content"],
-			user_id=tweet[0]["user_id"],
-			retweet_id=tweet[0].get("retweet_id"),
-			image_url=tweet[0].get("image_url"),
-			created_at=tweet[0]["created_at"],
-			user=UserBase(id=user["id"], username=user["username"], email=user["email"], profile_image_url=user['profile_image_url']),
-			retweet_count=retweet_count,
-			likes_count=likes_count,
-			is_liked=is_liked,
-			reply_to=reply_to
-		)
-	return tweet_data
+	tweets = hydrate_tweets(supabase, tweet, fields=selected)
+	tweets = apply_viewer_likes(supabase, tweets, user_id, fields=selected)
+	view_counter.record(tweets[0].id)
+	return select_item_fields(tweets[0], selected, TWEET_FIELDS)
 
 # Get retweets of tweet
 @app.get("/tweets/{tweet_id}/retweets")
-async def get_retweets(tweet_id: str, user_id: Optional[str] = None, page: int = 1, page_size: int = 10):
+async def get_retweets(tweet_id: str, user_id: Optional[str] = None, page: int = 1, page_size: int = 10, fields: Optional[str] = None):
+	selected = parse_fields(fields, TWEET_FIELDS)
+	supabase = get_read_client(user_id)
 	# Calculate offset
 	offset = (page - 1) * page_size
 	
 	# Fetch retweets for the tweet
 	response = supabase \
 		.table("tweets") \
-		.select("id, content, user_id, retweet_id, image_url, created_at, users(id, username, email, profile_image_url)") \
+		.select(TWEET_COLUMNS) \
 		.eq("retweet_id", tweet_id) \
 		.range(offset, offset + page_size - 1) \
 		.execute()
@@ -734,114 +662,59 @@ async def get_retweets(tweet_id: str, user_id: Optional[str] = None, page: int =
 	if not retweets:
 		raise HTTPException(status_code=404, detail="No retweets found")
 
-	reply_to_response = supabase \
-		.from_("tweets") \
-		.select("users(email)") \
-		.eq("id", tweet_id) \
-		.execute()
+	retweets_data = hydrate_tweets(supabase, retweets, fields=selected)
+	retweets_data = apply_viewer_likes(supabase, retweets_data, user_id, fields=selected)
+	view_counter.record(*(tweet.id for tweet in retweets_data))
 	
-	reply_to = None
-	if reply_to_response.data:
-		reply_to = reply_to_response.data[0]["users"]["email"]
-
-	retweets_data = []
-
-	for retweet in retweets:		
-		retweet_count_response = supabase \
-			.table("tweets") \
-			.select("id") \
-			.eq("retweet_id", retweet["id"]) \
-			.execute()
-
-		retweet_count = len(retweet_count_response.data) 
-
-		# Count the number of users who liked this tweet
-		likes_count_response = supabase \
-			.from_("tweet_likes") \
-			.select("id") \
-			.eq("tweet_id", retweet["id"]) \
-			.execute()
-			
-		likes_count = len(likes_count_response.data)
-
-		is_liked = False
-
-		if user_id:
-			is_liked_response = supabase \
-						.from_("tweet_likes") \
-						.select("id") \
-						.eq("tweet_id", retweet["id"]) \
-						.eq("user_id", user_id) \
-						.execute()
-					
-			is_liked = bool(is_liked_response.data)
-		
-		retweet_data = \
-			TweetResponse(
-				id=retweet["id"],
-				content=retweet["content"],
-				user_id=retweet["user_id"],
-				retweet_id=retweet.get("retweet_id"),
-				image_url=retweet.get("image_url"),
-				created_at=retweet["created_at"],
-				user=UserBase(
-					id=retweet["users"]["id"],
-					username=retweet["users"]["username"],
-					email=retweet["users"]["email"],
-					profile_image_url=retweet["users"]["profile_image_url"]
-				),
-				retweet_count=retweet_count,
-				likes_count=likes_count,
-				is_liked=is_liked,
-				reply_to=reply_to
-			)
-		retweets_data.append(retweet_data)
-	
-	return {"data": retweets_data, "page": page, "page_size": page_size}
+	return {"data": select_fields(retweets_data, selected, TWEET_FIELDS), "page": page, "page_size": page_size}
 
 # Toggle like a tweet
 @app.post("/tweets/{tweet_id}/toggle-like")
 async def toggle_like_tweet(tweet_id: str, request: TweetUserResponse):
+	if known_tweets.lookup(tweet_id) is False:
+		raise HTTPException(status_code=404, detail="Tweet not found")
+
+	supabase = get_supabase()
+	mark_write(request.user_id)
 	try:
-		# Check if the user has already likes the tweet
-		existing_like = supabase \
+		# Unlike, the delete doubles as the check whether the user already likes the tweet
+		response = supabase \
 			.from_("tweet_likes") \
-			.select("*") \
+			.delete() \
 			.eq("tweet_id", tweet_id) \
 			.eq("user_id", request.user_id) \
+			.select(EXISTENCE_COLUMNS) \
 			.execute()
-		if existing_like.data:
-			# User has already liked the tweet, then unlike it
-			response = supabase \
-				.from_("tweet_likes") \
-				.delete() \
-				.eq("tweet_id", tweet_id) \
-				.eq("user_id", request.user_id) \
-				.execute()
-			if not response.data:
-				raise HTTPException(status_code=500, detail="Failed to unlike the tweet")
+		if response.data:
 			return {"message": "Tweet unliked successfully!"}
 		else:
 			# User hasn't liked the tweet yet, so like it
 			response = supabase \
 				.from_("tweet_likes") \
 				.insert({"tweet_id": tweet_id, "user_id": str(request.user_id)}) \
+				.select(f"{EXISTENCE_COLUMNS}, {LIKED_TWEET_AUTHOR_EMBED}") \
 				.execute()
 			
 			if not response.data:
 				raise HTTPException(status_code=500, detail="Failed to like the tweet")
+			liked_tweet = response.data[0].get("tweets")
+			if liked_tweet:
+				notification_queue.notify("like", liked_tweet["user_id"], request.user_id, tweet_id)
 			return {"message": "Tweet liked successfully!"}
+	except BackendUnavailable:
+		raise
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 
 # Check if user already like a tweet
 @app.post("/tweets/{tweet_id}/like")
 async def check_like_status(tweet_id: str, request: TweetUserResponse):
+	supabase = get_read_client(request.user_id)
 	try:
 		# Check if the user has already likes the tweet
 		existing_like = supabase \
 			.from_("tweet_likes") \
-			.select("*") \
+			.select(EXISTENCE_COLUMNS) \
 			.eq("tweet_id", tweet_id) \
 			.eq("user_id", request.user_id) \
 			.execute()
@@ -849,6 +722,8 @@ async def check_like_status(tweet_id: str, request: TweetUserResponse):
 			return {"message": "User is not like this tweet yet", "status": False}
 		else:
 			return {"message": "User is already like this tweet", "status": True}
+	except BackendUnavailable:
+		raise
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 
@@ -860,6 +735,7 @@ async def create_tweet(
 	retweet_id: Optional[str] = Form(None),
 	image: Optional[UploadFile] = None
 ):
+	supabase = get_supabase()
 	try:
 		# Initialize image_url as None
 		image_url = None
@@ -868,11 +744,11 @@ async def create_tweet(
 		if image:
 			image_url = upload_image(image.file, folder="tweet_images")
 		
-		# If retweet_id is provided, check if the original tweet exists
-		if retweet_id:
-			response = supabase.table("tweets").select("*").eq("id", retweet_id).execute()
-			if not response.data:
-				return {"error": "The original tweet does not exist."}
+		# If retweet_id is provided, check if the original tweet exists. A
+		# false positive would make the insert fail, so only a known missing
+		# tweet skips the query.
+		if retweet_id and not check_exists(supabase, "tweets", known_tweets, retweet_id, trust_positive=False):
+			return {"error": "The original tweet does not exist."}
 		
 		# Prepare the tweet data
 		tweet_data = {
@@ -883,7 +759,16 @@ async def create_tweet(
 		}
 
 		# Insert the tweet data into the database
-		response = supabase.table("tweets").insert(tweet_data).execute()
+		response = supabase.table("tweets").insert(tweet_data).select(f"{TWEET_ROW_COLUMNS}, {PARENT_AUTHOR_EMBED}").execute()
+		mark_write(user_id)
+		known_tweets.add(*(tweet["id"] for tweet in response.data))
+		feed_snapshot.invalidate()
+
+		# Notify the author of the replied to tweet
+		for tweet in response.data:
+			parent = tweet.pop("parent", None)
+			if parent:
+				notification_queue.notify("reply", parent["user_id"], user_id, tweet["retweet_id"])
 
 		# Check for errors in the response
 		if not response:
@@ -898,23 +783,194 @@ async def create_tweet(
 	except RuntimeError as e:
 		return {"error": str(e)}
 
+# Import tweets from an NDJSON body, one TweetImport object per line. Lines
+# are validated as the body streams in and inserted batch_size at a time, so
+# memory use does not depend on the body size. Rejected lines are reported
+# with their line number (the first max_errors of them).
+#
+# Every line up to committed_line has been processed. With an import_id,
+# which must be unique per source file, rows without an id get one derived
+# from import_id, the line number and the line, so rows already stored by an
+# earlier attempt are skipped (counted as duplicates) when the same file is
+# sent again, and the progress is saved after each batch: to resume an
+# interrupted import, send the file again with the same import_id and earlier
+# lines are skipped unparsed (start_line overrides this).
+# GET /tweets/bulk/{import_id} returns the saved progress. Without an
+# import_id, rows without an id get a random one and can't be deduplicated.
+# Imported replies send no notifications.
+@app.post("/tweets/bulk")
+async def bulk_ingest_tweets(request: Request, import_id: Optional[str] = None, start_line: Optional[int] = None,
+	batch_size: int = 500, max_errors: int = 1000):
+	if import_id is not None and not 0 < len(import_id) <= MAX_IMPORT_ID_LENGTH:
+		raise HTTPException(status_code=400, detail=f"import_id must be 1 to {MAX_IMPORT_ID_LENGTH} characters")
+	supabase = get_supabase()
+	batch_size = max(1, min(batch_size, 1000))
+	progress = {"committed_line": 0, "inserted": 0, "duplicates": 0, "rejected": 0}
+	if import_id:
+		progress.update(await run_in_threadpool(load_progress, supabase, import_id) or {})
+	if start_line is None:
+		start_line = progress["committed_line"] + 1
+	progress["committed_line"] = start_line - 1
+	errors = []
+	last_line = start_line - 1
+	batch = []
+	inserted_now = 0
+	rejected_now = 0
+
+	def reject(number: int, error: str):
+		nonlocal rejected_now
+		progress["rejected"] += 1
+		rejected_now += 1
+		if len(errors) < max_errors:
+			errors.append({"line": number, "error": error})
+
+	async def commit():
+		nonlocal batch, inserted_now
+		if batch:
+			inserted_lines, duplicate_lines, batch_errors = await run_in_threadpool(insert_batch, supabase, batch)
+			progress["inserted"] += len(inserted_lines)
+			progress["duplicates"] += len(duplicate_lines)
+			inserted_now += len(inserted_lines)
+			for number, error in sorted(batch_errors.items()):
+				reject(number, error)
+			mark_write(*{row["user_id"] for _, row in batch})
+			batch = []
+		if last_line > progress["committed_line"]:
+			progress["committed_line"] = last_line
+			if import_id:
+				await run_in_threadpool(save_progress, supabase, import_id, progress)
+
+	async for number, line in read_lines(request.stream()):
+		if number < start_line:
+			continue
+		last_line = number
+		try:
+			batch.append((number, parse_row(line, number, import_id)))
+		except ValueError as e:
+			reject(number, str(e))
+		if len(batch) >= batch_size:
+			await commit()
+	await commit()
+
+	if inserted_now:
+		feed_snapshot.invalidate()
+	# Totals cover every attempt of the import, errors only this one
+	return {
+		"import_id": import_id,
+		**progress,
+		"errors": errors,
+		"errors_truncated": rejected_now > len(errors)
+	}
+
+# Saved progress of an import started with an import_id
+@app.get("/tweets/bulk/{import_id}")
+async def get_import_progress(import_id: str):
+	progress = load_progress(get_supabase(), import_id)
+	if progress is None:
+		raise HTTPException(status_code=404, detail="Import not found")
+	return {"import_id": import_id, **progress}
+
+# Clean up after a deleted tweet: its likes, the reference held by its replies
+# and its image. Runs as a background task once the response has been sent.
+def cascade_tweet_delete(tweet: dict):
+	supabase = get_supabase()
+	try:
+		supabase \
+			.from_("tweet_likes") \
+			.delete(returning="minimal") \
+			.eq("tweet_id", tweet["id"]) \
+			.execute()
+
+		# Replies stay visible as standalone tweets
+		supabase \
+			.from_("tweets") \
+			.update({"retweet_id": None}, returning="minimal") \
+			.eq("retweet_id", tweet["id"]) \
+			.execute()
+
+		# Replies lost their reply_to, rebuild the cached feed
+		feed_snapshot.invalidate()
+
+		delete_images([tweet.get("image_url")])
+	except Exception:
+		logger.exception("Cleanup of deleted tweet %s failed", tweet["id"])
+
 @app.delete("/tweets/{tweet_id}")
-async def delete_tweet(tweet_id: str):
-	existing_tweet_response = supabase \
-		.from_("tweets") \
-		.select("*") \
-		.eq("id", tweet_id) \
-		.execute()
-	if not existing_tweet_response.data:
-		raise HTTPException(status_code=404, detail="Tweet not found")
-	
+async def delete_tweet(tweet_id: str, background_tasks: BackgroundTasks):
+	supabase = get_supabase()
+	# Delete and return the row in one round trip, nothing returned means no such tweet
 	response = supabase \
 		.from_("tweets") \
 		.delete() \
 		.eq("id", tweet_id) \
+		.select(TWEET_ROW_COLUMNS) \
 		.execute()
 
 	if not response.data:
-		raise HTTPException(status_code=500, detail="Failed to delete tweet")
+		known_tweets.mark_missing(tweet_id)
+		raise HTTPException(status_code=404, detail="Tweet not found")
+
+	tweet = response.data[0]
+	known_tweets.discard(tweet_id)
+	mark_write(tweet["user_id"])
+	feed_snapshot.invalidate()
+	background_tasks.add_task(cascade_tweet_delete, tweet)
 	
-	return {"message": "Tweet deleted successfully"}
\ No newline at end of file
+	return {"message": "Tweet deleted successfully"}
+
+# Get notifications of user, newest activity first. Pass the returned
+# next_cursor to get the following page.
+@app.get("/notifications/{user_id}")
+async def get_notifications(user_id: str, cursor: Optional[str] = None, limit: int = 20):
+	if known_users.lookup(user_id) is False:
+		raise HTTPException(status_code=404, detail="User not found")
+
+	position = None
+	if cursor:
+		position = decode_cursor(cursor)
+		if position is None:
+			raise HTTPException(status_code=400, detail="Invalid cursor")
+
+	limit = max(1, min(limit, 100))
+	supabase = get_read_client(user_id)
+	query = supabase \
+		.from_("notifications") \
+		.select(NOTIFICATION_COLUMNS) \
+		.eq("user_id", user_id)
+	if position:
+		updated_at, notification_id = position
+		query = query.or_(f'updated_at.lt."{updated_at}",and(updated_at.eq."{updated_at}",id.lt.{notification_id})')
+	# One extra row tells whether there is a next page
+	rows = query \
+		.order("updated_at", desc=True) \
+		.order("id", desc=True) \
+		.limit(limit + 1) \
+		.execute() \
+		.data
+
+	next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+	rows = rows[:limit]
+
+	# Kept up to date by a trigger, so counting never scans the notifications
+	counts_response = supabase \
+		.from_("notification_counts") \
+		.select("unread") \
+		.eq("user_id", user_id) \
+		.execute()
+	unread_count = counts_response.data[0]["unread"] if counts_response.data else 0
+
+	notifications = hydrate_notifications(supabase, rows)
+	return {"data": notifications, "next_cursor": next_cursor, "unread_count": unread_count}
+
+# Mark every notification of user as read
+@app.post("/notifications/{user_id}/read")
+async def mark_notifications_read(user_id: str):
+	supabase = get_supabase()
+	supabase \
+		.from_("notifications") \
+		.update({"read": True}, returning="minimal") \
+		.eq("user_id", user_id) \
+		.eq("read", False) \
+		.execute()
+	mark_write(user_id)
+	return {"message": "Notifications marked as read"}
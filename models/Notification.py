@@ -0,0 +1,24 @@
+from pydantic import BaseModel, HttpUrl
+from typing import Literal, Optional
+from datetime import datetime
+from uuid import UUID
+
+# User who liked, followed or replied
+class NotificationActor(BaseModel):
+	id: UUID
+	username: str
+	profile_image_url: Optional[HttpUrl] = None
+
+# Events of one type on one target, coalesced while unread
+class NotificationResponse(BaseModel):
+	id: UUID
+	type: Literal["like", "follow", "reply"]
+	# The liked or replied to tweet, None for follows
+	tweet_id: Optional[UUID] = None
+	# Most recent actors first
+	actors: list[NotificationActor]
+	actor_count: int
+	message: str
+	read: bool
+	created_at: datetime
+	updated_at: datetime
@@ -17,6 +17,16 @@ class TweetUpdate(BaseModel):
     retweet_id: Optional[str] = None
     image_url: Optional[HttpUrl] = None
 
+# TweetImport for one row of a bulk ingest, ids and dates may come from
+# another platform
+class TweetImport(BaseModel):
+    id: Optional[UUID] = None
+    content: str
+    user_id: UUID
+    retweet_id: Optional[UUID] = None
+    image_url: Optional[HttpUrl] = None
+    created_at: Optional[datetime] = None
+
 # TweetResponse for returning tweet details (i.e., after creation)
 class TweetResponse(BaseModel):
     id: UUID
@@ -26,10 +36,12 @@ class TweetResponse(BaseModel):
     image_url: Optional[HttpUrl]
     created_at: Optional[datetime]
     user: UserBase
-    retweet_count: int
-    likes_count: int
-    is_liked: bool
+    # Computed fields, left unset when excluded with the `fields` parameter
+    retweet_count: Optional[int] = None
+    likes_count: Optional[int] = None
+    is_liked: Optional[bool] = None
     reply_to: Optional[str] = None
+    view_count: Optional[int] = None
 
 # Tweet model (you may use this for internal representations in DB models)
 class Tweet(BaseModel):
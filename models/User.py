@@ -30,6 +30,12 @@ class UserCreate(UserBase):
 class UserResponse(UserBase):
 	id: UUID  # Include id in the response model
 	
+# Response model for who-to-follow suggestions
+class UserSuggestionResponse(UserResponse):
+	score: int
+	mutual_count: int
+	follows_you: bool
+
 class UserAccess(BaseModel):
 	access_token: str
 
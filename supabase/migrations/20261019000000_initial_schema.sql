@@ -0,0 +1,55 @@
+-- Tables used by the API. users.id is the id of the Supabase Auth user
+-- created at sign-up.
+
+create table if not exists public.roles (
+	id uuid primary key default gen_random_uuid(),
+	name text not null unique
+);
+
+-- Role assigned by /signup
+insert into public.roles (id, name)
+values ('d380cc38-cd59-4e4a-8f5d-4a6afec84fca', 'user')
+on conflict do nothing;
+
+create table if not exists public.users (
+	id uuid primary key,
+	username text not null,
+	email text not null unique,
+	password text,
+	bio text,
+	profile_image_url text,
+	background_image_url text,
+	role_id uuid references public.roles (id),
+	created_at timestamptz not null default now()
+);
+
+create table if not exists public.tweets (
+	id uuid primary key default gen_random_uuid(),
+	user_id uuid not null,
+	content text not null,
+	-- Tweet this one replies to
+	retweet_id uuid,
+	image_url text,
+	created_at timestamptz not null default now(),
+	constraint tweets_user_id_fkey foreign key (user_id) references public.users (id) on delete cascade,
+	constraint tweets_retweet_id_fkey foreign key (retweet_id) references public.tweets (id) on delete set null
+);
+
+create table if not exists public.tweet_likes (
+	id uuid primary key default gen_random_uuid(),
+	tweet_id uuid not null,
+	user_id uuid not null,
+	created_at timestamptz not null default now(),
+	constraint tweet_likes_tweet_id_fkey foreign key (tweet_id) references public.tweets (id) on delete cascade,
+	constraint tweet_likes_user_id_fkey foreign key (user_id) references public.users (id) on delete cascade
+);
+
+-- user_id is the followed user, follower_id the one following them
+create table if not exists public.user_followers (
+	id uuid primary key default gen_random_uuid(),
+	user_id uuid not null,
+	follower_id uuid not null,
+	created_at timestamptz not null default now(),
+	constraint user_followers_user_id_fkey foreign key (user_id) references public.users (id) on delete cascade,
+	constraint user_followers_follower_id_fkey foreign key (follower_id) references public.users (id) on delete cascade
+);
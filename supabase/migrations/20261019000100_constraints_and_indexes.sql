@@ -0,0 +1,104 @@
+-- Constraints the API relies on and indexes matching its queries.
+-- Written to also apply to databases created before these migrations, which
+-- may hold duplicate or orphaned rows.
+
+-- Likes and follows left behind by deleted tweets and users
+delete from public.tweet_likes l
+where not exists (select 1 from public.tweets t where t.id = l.tweet_id)
+	or not exists (select 1 from public.users u where u.id = l.user_id);
+
+delete from public.user_followers f
+where not exists (select 1 from public.users u where u.id = f.user_id)
+	or not exists (select 1 from public.users u where u.id = f.follower_id);
+
+update public.tweets t
+set retweet_id = null
+where retweet_id is not null
+	and not exists (select 1 from public.tweets p where p.id = t.retweet_id);
+
+-- Keep one row of duplicated likes and follows
+delete from public.tweet_likes l
+using public.tweet_likes d
+where l.tweet_id = d.tweet_id
+	and l.user_id = d.user_id
+	and l.ctid > d.ctid;
+
+delete from public.user_followers f
+using public.user_followers d
+where f.user_id = d.user_id
+	and f.follower_id = d.follower_id
+	and f.ctid > d.ctid;
+
+-- Foreign keys, named as the user list embeds in utils/users.py expect.
+-- Columns that already have a foreign key keep it, as a second one would
+-- make the PostgREST embeds ambiguous.
+do $$
+declare
+	fk record;
+begin
+	for fk in
+		select * from (values
+			('tweets', 'user_id', 'tweets_user_id_fkey', 'references public.users (id) on delete cascade'),
+			('tweets', 'retweet_id', 'tweets_retweet_id_fkey', 'references public.tweets (id) on delete set null'),
+			('tweet_likes', 'tweet_id', 'tweet_likes_tweet_id_fkey', 'references public.tweets (id) on delete cascade'),
+			('tweet_likes', 'user_id', 'tweet_likes_user_id_fkey', 'references public.users (id) on delete cascade'),
+			('user_followers', 'user_id', 'user_followers_user_id_fkey', 'references public.users (id) on delete cascade'),
+			('user_followers', 'follower_id', 'user_followers_follower_id_fkey', 'references public.users (id) on delete cascade')
+		) as t (table_name, column_name, constraint_name, target)
+	loop
+		if not exists (
+			select 1
+			from pg_constraint c
+			join pg_attribute a on a.attrelid = c.conrelid and a.attnum = any (c.conkey)
+			where c.contype = 'f'
+				and c.conrelid = format('public.%I', fk.table_name)::regclass
+				and a.attname = fk.column_name
+		) then
+			execute format(
+				'alter table public.%I add constraint %I foreign key (%I) %s',
+				fk.table_name, fk.constraint_name, fk.column_name, fk.target
+			);
+		end if;
+	end loop;
+end $$;
+
+-- toggle-like: one like per user and tweet. Serves likes_count
+-- (tweet_id = ?) and the existence check (tweet_id = ? and user_id = ?).
+create unique index if not exists tweet_likes_tweet_id_user_id_key
+	on public.tweet_likes (tweet_id, user_id);
+
+-- is_liked for a page of tweets: user_id = ? and tweet_id in (...)
+create index if not exists tweet_likes_user_id_tweet_id_idx
+	on public.tweet_likes (user_id, tweet_id);
+
+-- toggle follow: one follow per pair. Serves follower_count (user_id = ?)
+-- and the followers page (user_id = ? order by follower_id) index-only.
+create unique index if not exists user_followers_user_id_follower_id_key
+	on public.user_followers (user_id, follower_id);
+
+-- following_count, the followings page (follower_id = ? order by user_id)
+-- and is_followed (follower_id = ? and user_id in (...))
+create index if not exists user_followers_follower_id_user_id_idx
+	on public.user_followers (follower_id, user_id);
+
+-- Global feed: order by created_at desc
+create index if not exists tweets_created_at_idx
+	on public.tweets (created_at desc);
+
+-- Feed with no_retweets: retweet_id is null order by created_at desc
+create index if not exists tweets_top_level_created_at_idx
+	on public.tweets (created_at desc)
+	where retweet_id is null;
+
+-- Profile tweets (user_id = ? order by created_at desc) and tweet_count
+create index if not exists tweets_user_id_created_at_idx
+	on public.tweets (user_id, created_at desc);
+
+-- Replies of a tweet and retweet_count (retweet_id = ?)
+create index if not exists tweets_retweet_id_created_at_idx
+	on public.tweets (retweet_id, created_at desc)
+	where retweet_id is not null;
+
+-- /users: order by created_at desc
+create index if not exists users_created_at_idx
+	on public.users (created_at desc);
@@ -0,0 +1,106 @@
+-- Notifications for likes, follows and replies, written in batches by the
+-- worker in utils/notifications.py.
+
+-- Events of one type on one target are coalesced into a single notification
+-- ("12 people liked your tweet") for as long as it is unread. actor_ids keeps
+-- the most recent actors first, actor_count counts all of them.
+create table if not exists public.notifications (
+	id uuid primary key default gen_random_uuid(),
+	-- The user notified
+	user_id uuid not null,
+	type text not null check (type in ('like', 'follow', 'reply')),
+	-- The liked or replied to tweet, null for follows
+	tweet_id uuid,
+	actor_ids uuid[] not null,
+	actor_count integer not null,
+	read boolean not null default false,
+	created_at timestamptz not null default now(),
+	updated_at timestamptz not null default now(),
+	constraint notifications_user_id_fkey foreign key (user_id) references public.users (id) on delete cascade,
+	constraint notifications_tweet_id_fkey foreign key (tweet_id) references public.tweets (id) on delete cascade
+);
+
+-- The notification events are coalesced into: at most one unread per target
+create unique index if not exists notifications_unread_key
+	on public.notifications (user_id, type, tweet_id) nulls not distinct
+	where not read;
+
+-- GET /notifications/{user_id}: user_id = ? order by updated_at desc, id desc
+create index if not exists notifications_user_id_updated_at_idx
+	on public.notifications (user_id, updated_at desc, id desc);
+
+-- Unread notifications per user, kept by the triggers below so reading the
+-- count never scans notifications
+create table if not exists public.notification_counts (
+	user_id uuid primary key,
+	unread integer not null default 0,
+	constraint notification_counts_user_id_fkey foreign key (user_id) references public.users (id) on delete cascade
+);
+
+create or replace function public.count_unread_notifications()
+returns trigger
+language plpgsql
+as $$
+declare
+	change integer := 0;
+	target uuid;
+begin
+	if tg_op = 'INSERT' then
+		target := new.user_id;
+		change := case when new.read then 0 else 1 end;
+	elsif tg_op = 'DELETE' then
+		target := old.user_id;
+		change := case when old.read then 0 else -1 end;
+	else
+		target := new.user_id;
+		change := (case when new.read then 0 else 1 end) - (case when old.read then 0 else 1 end);
+	end if;
+
+	if change <> 0 then
+		insert into public.notification_counts as c (user_id, unread)
+		values (target, greatest(change, 0))
+		on conflict (user_id) do update set unread = greatest(c.unread + change, 0);
+	end if;
+	return null;
+end $$;
+
+drop trigger if exists notifications_count_unread on public.notifications;
+create trigger notifications_count_unread
+	after insert or delete or update of read on public.notifications
+	for each row execute function public.count_unread_notifications();
+
+-- Merge a batch of coalesced events in one call. Each element is
+-- {user_id, type, tweet_id, actor_ids, actor_count, at} with actor_ids newest
+-- first, at most 50 of the actor_count actors. New actors are added to the
+-- unread notification of the same target, or a new one is created.
+create or replace function public.add_notifications(notifications jsonb)
+returns void
+language sql
+as $$
+	insert into public.notifications as n (user_id, type, tweet_id, actor_ids, actor_count, created_at, updated_at)
+	select
+		(e ->> 'user_id')::uuid,
+		e ->> 'type',
+		(e ->> 'tweet_id')::uuid,
+		(array(select jsonb_array_elements_text(e -> 'actor_ids')::uuid))[1:50],
+		(e ->> 'actor_count')::integer,
+		(e ->> 'at')::timestamptz,
+		(e ->> 'at')::timestamptz
+	from jsonb_array_elements(notifications) e
+	-- Skip events on users and tweets deleted since they were queued
+	where exists (select 1 from public.users u where u.id = (e ->> 'user_id')::uuid)
+		and (
+			e ->> 'tweet_id' is null
+			or exists (select 1 from public.tweets t where t.id = (e ->> 'tweet_id')::uuid)
+		)
+	on conflict (user_id, type, tweet_id) where not read do update
+	set actor_ids = (
+			array(select a from unnest(excluded.actor_ids) a where a <> all (n.actor_ids))
+			|| n.actor_ids
+		)[1:50],
+		-- Listed actors already notified are not counted twice, unlisted ones are
+		actor_count = n.actor_count
+			+ cardinality(array(select a from unnest(excluded.actor_ids) a where a <> all (n.actor_ids)))
+			+ excluded.actor_count - cardinality(excluded.actor_ids),
+		updated_at = greatest(n.updated_at, excluded.updated_at);
+$$;
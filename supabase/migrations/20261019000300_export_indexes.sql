@@ -0,0 +1,12 @@
+-- Indexes for GET /user/{id}/export, which reads a user's rows in keyset
+-- pages: <user column> = ? and created_at >= ? order by created_at, id.
+-- The user's tweets are served by tweets_user_id_created_at_idx.
+
+create index if not exists tweet_likes_user_id_created_at_idx
+	on public.tweet_likes (user_id, created_at, id);
+
+create index if not exists user_followers_user_id_created_at_idx
+	on public.user_followers (user_id, created_at, id);
+
+create index if not exists user_followers_follower_id_created_at_idx
+	on public.user_followers (follower_id, created_at, id);
@@ -0,0 +1,23 @@
+-- View counts of tweets, kept apart from tweets so counting a view does not
+-- rewrite the tweet row. Views are buffered by each API worker (see
+-- utils/views.py) and added in batches through add_tweet_views.
+create table if not exists public.tweet_views (
+	tweet_id uuid primary key,
+	view_count bigint not null default 0,
+	constraint tweet_views_tweet_id_fkey foreign key (tweet_id) references public.tweets (id) on delete cascade
+);
+
+-- Add a batch of [{tweet_id, count}] to the view counts in one call. Rows are
+-- locked in tweet_id order so concurrent flushes can't deadlock.
+create or replace function public.add_tweet_views(views jsonb)
+returns void
+language sql
+as $$
+	insert into public.tweet_views as v (tweet_id, view_count)
+	select (e ->> 'tweet_id')::uuid, (e ->> 'count')::bigint
+	from jsonb_array_elements(views) e
+	-- Skip tweets deleted since they were viewed
+	where exists (select 1 from public.tweets t where t.id = (e ->> 'tweet_id')::uuid)
+	order by 1
+	on conflict (tweet_id) do update set view_count = v.view_count + excluded.view_count;
+$$;
@@ -0,0 +1,14 @@
+-- likes_count and retweet_count of many tweets in one call, for hydrating a
+-- page of tweets. Each count is an index lookup, on
+-- tweet_likes_tweet_id_user_id_key and tweets_retweet_id_created_at_idx.
+create or replace function public.tweet_counts(tweet_ids uuid[])
+returns table (id uuid, likes_count bigint, retweet_count bigint)
+language sql
+stable
+as $$
+	select
+		t.id,
+		(select count(*) from public.tweet_likes l where l.tweet_id = t.id),
+		(select count(*) from public.tweets r where r.retweet_id = t.id)
+	from unnest(tweet_ids) as t (id);
+$$;
@@ -0,0 +1,13 @@
+-- Progress of bulk tweet imports (POST /tweets/bulk with an import_id), saved
+-- after every batch so an interrupted upload can be resumed where it stopped
+-- even when the client never received the response.
+create table if not exists public.tweet_imports (
+	id text primary key,
+	-- Every line up to committed_line has been processed
+	committed_line integer not null default 0,
+	inserted integer not null default 0,
+	-- Rows skipped as already stored, from an earlier attempt
+	duplicates integer not null default 0,
+	rejected integer not null default 0,
+	updated_at timestamptz not null default now()
+);
@@ -1,41 +1,75 @@
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
-import os
+from cloudinary.exceptions import AlreadyExists, AuthorizationRequired, BadRequest, NotAllowed, NotFound
+from threading import Lock
+from utils.config import get_settings
+from utils.resilience import CircuitOpenError, cloudinary_breaker
 
-CLOUDINARY_NAME = os.getenv('CLOUDINARY_NAME')
-CLOUDINARY_API_KEY = os.getenv('CLOUDINARY_API_KEY')
-CLOUDINARY_API_SECRET = os.getenv('CLOUDINARY_API_SECRET')
+_configured = False
+_configure_lock = Lock()
 
-cloudinary.config(
-	cloud_name=CLOUDINARY_NAME, 
-	api_key=CLOUDINARY_API_KEY, 
-	api_secret=CLOUDINARY_API_SECRET,
-	secure=True
-)
+# Configure the Cloudinary SDK on first use instead of at import
+def configure_cloudinary():
+	global _configured
+	if _configured:
+		return
+	with _configure_lock:
+		if not _configured:
+			settings = get_settings()
+			cloudinary.config(
+				cloud_name=settings.cloudinary_name, 
+				api_key=settings.cloudinary_api_key, 
+				api_secret=settings.cloudinary_api_secret,
+				secure=True
+			)
+			cloudinary_breaker.configure(settings.breaker_failure_threshold, settings.breaker_reset_timeout)
+			_configured = True
+
+# Errors that are Cloudinary rejecting a request rather than failing to answer
+def _is_outage(error: Exception) -> bool:
+	return not isinstance(error, (AlreadyExists, AuthorizationRequired, BadRequest, NotAllowed, NotFound))
 
 def upload_image(image_file, folder):
+	configure_cloudinary()
 	try:
 		# Upload the image with transformation to limit the width to 1920px
-		result = cloudinary.uploader.upload(
+		result = cloudinary_breaker.call(
+			cloudinary.uploader.upload,
 			image_file,
 			folder=folder,
 			transformation=[
 				{'width': 1920, 'crop': 'limit'}  # Ensures the image width is limited to 1920px
-			]
+			],
+			timeout=get_settings().cloudinary_timeout,
+			is_failure=_is_outage
 		)
 		return result["secure_url"]
+	except CircuitOpenError:
+		raise
 	except Exception as e:
 		raise RuntimeError(f"Image upload failed: {str(e)}")
 
+# Extract the Cloudinary public id from a delivery URL, None for foreign URLs
+def get_public_id(image_url: str):
+	if not image_url or "res.cloudinary.com" not in image_url:
+		return None
+	return '/'.join(image_url.split('/upload/')[1].split('.')[0].split('/')[1:])
+
 # Function to delete image from Cloudinary
 def delete_image(image_url: str):
-	public_id = None
-	if image_url:
-		if "res.cloudinary.com" not in image_url:
-			print("Return")
-			return
-		public_id = '/'.join(image_url.split('/upload/')[1].split('.')[0].split('/')[1:])
-	
+	public_id = get_public_id(image_url)
 	if public_id:
-		cloudinary.api.delete_resources([public_id])
\ No newline at end of file
+		configure_cloudinary()
+		cloudinary_breaker.call(cloudinary.api.delete_resources, [public_id],
+			timeout=get_settings().cloudinary_timeout, is_failure=_is_outage)
+
+# Delete several images with one Admin API call per 100 public ids
+def delete_images(image_urls):
+	public_ids = [public_id for public_id in map(get_public_id, image_urls) if public_id]
+	if not public_ids:
+		return
+	configure_cloudinary()
+	for start in range(0, len(public_ids), 100):
+		cloudinary_breaker.call(cloudinary.api.delete_resources, public_ids[start:start + 100],
+			timeout=get_settings().cloudinary_timeout, is_failure=_is_outage)
@@ -0,0 +1,37 @@
+# Column lists passed to select(), one per shape of row the API reads.
+# Queries name their columns rather than select("*"), so they only transfer
+# what they use and never read users.password.
+
+# A user as shown on a profile card, UserResponse without its computed fields
+PROFILE_CARD_COLUMNS = "id, email, username, bio, profile_image_url, background_image_url, created_at"
+
+# The author embedded in a tweet, UserBase
+AUTHOR_STUB_COLUMNS = "id, username, email, profile_image_url"
+
+# A tweet row on its own
+TWEET_ROW_COLUMNS = "id, content, user_id, retweet_id, image_url, created_at"
+
+# A tweet with its author, TweetResponse without its computed fields
+TWEET_COLUMNS = f"{TWEET_ROW_COLUMNS}, users({AUTHOR_STUB_COLUMNS})"
+
+# The author of the liked tweet, embedded in a tweet_likes row
+LIKED_TWEET_AUTHOR_EMBED = "tweets(user_id)"
+
+# The author of the replied to tweet, embedded in a tweets row through retweet_id
+PARENT_AUTHOR_EMBED = "parent:retweet_id(user_id)"
+
+# A like and a follow edge, as exported
+LIKE_ROW_COLUMNS = "id, tweet_id, user_id, created_at"
+FOLLOW_ROW_COLUMNS = "id, user_id, follower_id, created_at"
+
+# A user listed as the actor of a notification
+ACTOR_COLUMNS = "id, username, profile_image_url"
+
+# A notification, its actors are fetched separately
+NOTIFICATION_COLUMNS = "id, type, tweet_id, actor_ids, actor_count, read, created_at, updated_at"
+
+# The images of a user, read to delete the replaced ones
+USER_IMAGE_COLUMNS = "profile_image_url, background_image_url"
+
+# Existence checks, and writes whose result is only tested for emptiness
+EXISTENCE_COLUMNS = "id"
@@ -0,0 +1,109 @@
+from functools import lru_cache
+from typing import Optional
+from pydantic import BaseModel
+from dotenv import load_dotenv
+import os
+
+# Settings read from the environment (and .env) the first time they are needed,
+# so importing the app does not require credentials
+class Settings(BaseModel):
+	supabase_url: Optional[str] = None
+	supabase_key: Optional[str] = None
+	# Read replica endpoints for GET handlers, the key defaults to supabase_key
+	supabase_replica_urls: list[str] = []
+	supabase_replica_key: Optional[str] = None
+	# How long a user's reads stay on the primary after they wrote
+	read_your_writes_seconds: float = 10.0
+	# Seconds a Supabase read may take in total, and each phase of a write
+	supabase_timeout: float = 10.0
+	# Reads slower than this percentile of recent reads are sent a second
+	# time, the first answer wins (0 disables)
+	hedge_percentile: float = 95.0
+	# Last successful Supabase reads, served marked stale while it is down, at
+	# most stale_cache_size responses and stale_cache_max_bytes of bodies (0 disables)
+	stale_cache_size: int = 1000
+	stale_cache_max_bytes: int = 32 * 1024 * 1024
+	# Each backend's breaker opens after failure_threshold consecutive failures
+	# and lets a trial call through reset_timeout seconds later
+	breaker_failure_threshold: int = 5
+	breaker_reset_timeout: float = 30.0
+	cloudinary_name: Optional[str] = None
+	cloudinary_api_key: Optional[str] = None
+	cloudinary_api_secret: Optional[str] = None
+	cloudinary_timeout: float = 30.0
+	jwt_secret_key: Optional[str] = None
+	jwt_algorithm: Optional[str] = None
+	access_token_expire_minutes: Optional[str] = None
+	# Pre-open connection pools and prime caches before reporting ready
+	warmup: bool = False
+	# Number of newest feed tweets kept in memory (0 disables the snapshot)
+	feed_snapshot_size: int = 50
+	feed_snapshot_interval: float = 5.0
+	# In-memory follower graph for suggestions, reloaded every interval seconds
+	follow_graph: bool = True
+	follow_graph_interval: float = 600.0
+	# Notifications for likes, follows and replies, written by a background
+	# worker every interval seconds or once batch_size are pending
+	notifications: bool = True
+	notification_batch_size: int = 500
+	notification_interval: float = 2.0
+	notification_max_pending: int = 10000
+	# Tweet views, buffered in memory and written every interval seconds or
+	# once max_tweets tweets have pending views
+	view_counts: bool = True
+	view_flush_interval: float = 10.0
+	view_buffer_size: int = 10000
+	# Opt-in request profiling, see utils/profiling.py
+	profiling: bool = False
+	profiling_sample_rate: float = 0.0
+	profiling_token: Optional[str] = None
+	profiling_dir: str = "profiles"
+
+def _flag(name: str, default: bool = False) -> bool:
+	value = os.getenv(name)
+	if value is None:
+		return default
+	return value.strip().lower() in ("1", "true", "yes", "on")
+
+def _list(name: str) -> list[str]:
+	return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+@lru_cache
+def get_settings() -> Settings:
+	load_dotenv()
+	return Settings(
+		supabase_url=os.getenv("SUPABASE_URL"),
+		supabase_key=os.getenv("SUPABASE_KEY"),
+		supabase_replica_urls=_list("SUPABASE_REPLICA_URLS"),
+		supabase_replica_key=os.getenv("SUPABASE_REPLICA_KEY"),
+		read_your_writes_seconds=float(os.getenv("READ_YOUR_WRITES_SECONDS", "10")),
+		supabase_timeout=float(os.getenv("SUPABASE_TIMEOUT", "10")),
+		hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+		stale_cache_size=int(os.getenv("STALE_CACHE_SIZE", "1000")),
+		stale_cache_max_bytes=int(os.getenv("STALE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+		breaker_failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+		breaker_reset_timeout=float(os.getenv("BREAKER_RESET_TIMEOUT", "30")),
+		cloudinary_name=os.getenv("CLOUDINARY_NAME"),
+		cloudinary_api_key=os.getenv("CLOUDINARY_API_KEY"),
+		cloudinary_api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+		cloudinary_timeout=float(os.getenv("CLOUDINARY_TIMEOUT", "30")),
+		jwt_secret_key=os.getenv("JWT_SECRET_KEY"),
+		jwt_algorithm=os.getenv("JWT_ALGORITHM"),
+		access_token_expire_minutes=os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"),
+		warmup=_flag("WARMUP"),
+		feed_snapshot_size=int(os.getenv("FEED_SNAPSHOT_SIZE", "50")),
+		feed_snapshot_interval=float(os.getenv("FEED_SNAPSHOT_INTERVAL", "5")),
+		follow_graph=_flag("FOLLOW_GRAPH", True),
+		follow_graph_interval=float(os.getenv("FOLLOW_GRAPH_INTERVAL", "600")),
+		notifications=_flag("NOTIFICATIONS", True),
+		notification_batch_size=int(os.getenv("NOTIFICATION_BATCH_SIZE", "500")),
+		notification_interval=float(os.getenv("NOTIFICATION_INTERVAL", "2")),
+		notification_max_pending=int(os.getenv("NOTIFICATION_MAX_PENDING", "10000")),
+		view_counts=_flag("VIEW_COUNTS", True),
+		view_flush_interval=float(os.getenv("VIEW_FLUSH_INTERVAL", "10")),
+		view_buffer_size=int(os.getenv("VIEW_BUFFER_SIZE", "10000")),
+		profiling=_flag("PROFILING"),
+		profiling_sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+		profiling_token=os.getenv("PROFILING_TOKEN") or None,
+		profiling_dir=os.getenv("PROFILING_DIR", "profiles"),
+	)
@@ -0,0 +1,176 @@
+from contextvars import ContextVar
+from threading import Lock
+from typing import Optional, TYPE_CHECKING
+from utils.config import get_settings
+from utils.columns import EXISTENCE_COLUMNS
+from utils.resilience import CircuitBreaker, supabase_breaker
+import itertools
+import math
+import time
+
+if TYPE_CHECKING:
+	from supabase import Client
+
+_client: Optional["Client"] = None
+_replicas: Optional[list["Client"]] = None
+_replica_breakers: list[CircuitBreaker] = []
+_replica_cycle = None
+_client_lock = Lock()
+_stale_cache = None
+
+# Users that wrote recently, mapped to the monotonic time their marker expires
+_recent_writes: dict[str, float] = {}
+_recent_writes_lock = Lock()
+
+# The markers above only exist in the worker that handled the write. The
+# client also gets the end of its read-your-writes window, as an epoch time,
+# in a cookie and a response header, and sends it back with its next requests
+# (the cookie, or the header as a request header) to whichever worker serves them.
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+READ_YOUR_WRITES_HEADER = b"x-read-primary-until"
+
+# {"until": end of the current client's window, "wrote": whether this request wrote}
+_client_writes: ContextVar[Optional[dict]] = ContextVar("client_writes", default=None)
+
+# Create a client whose requests go through breaker, with deadlines and
+# hedged reads (see utils/resilient_http.py)
+def _create_client(url: str, key: str, breaker: CircuitBreaker) -> "Client":
+	global _stale_cache
+	from supabase import create_client, ClientOptions
+	from utils.resilient_http import StaleCache, resilient_client
+	settings = get_settings()
+	breaker.configure(settings.breaker_failure_threshold, settings.breaker_reset_timeout)
+	if _stale_cache is None and settings.stale_cache_size > 0 and settings.stale_cache_max_bytes > 0:
+		_stale_cache = StaleCache(settings.stale_cache_size, settings.stale_cache_max_bytes)
+	http_client = resilient_client(breaker, settings.supabase_timeout, settings.hedge_percentile, _stale_cache)
+	return create_client(url, key, ClientOptions(httpx_client=http_client))
+
+# Return the shared Supabase client, creating it on first use.
+# The supabase package itself is imported here as it is slow to load.
+def get_supabase() -> "Client":
+	global _client
+	if _client is None:
+		with _client_lock:
+			if _client is None:
+				settings = get_settings()
+				_client = _create_client(settings.supabase_url, settings.supabase_key, supabase_breaker)
+	return _client
+
+# Each replica is a backend of its own, with its own breaker
+def _get_replicas() -> list["Client"]:
+	global _replicas, _replica_cycle
+	if _replicas is None:
+		with _client_lock:
+			if _replicas is None:
+				settings = get_settings()
+				replicas = []
+				for number, url in enumerate(settings.supabase_replica_urls, 1):
+					breaker = CircuitBreaker(f"supabase replica {number}")
+					replicas.append(_create_client(url, settings.supabase_replica_key or settings.supabase_key, breaker))
+					_replica_breakers.append(breaker)
+				_replica_cycle = itertools.cycle(list(zip(replicas, _replica_breakers)))
+				_replicas = replicas
+	return _replicas
+
+# Remember that a user just wrote, so their reads go to the primary for a while
+def mark_write(*user_ids):
+	now = time.monotonic()
+	expires_at = now + get_settings().read_your_writes_seconds
+	with _recent_writes_lock:
+		# Sweep expired markers of users that never read again
+		if len(_recent_writes) > 10000:
+			for key in [key for key, expiry in _recent_writes.items() if expiry <= now]:
+				del _recent_writes[key]
+		for user_id in user_ids:
+			if user_id:
+				_recent_writes[str(user_id)] = expires_at
+	client = _client_writes.get()
+	if client is not None:
+		client["until"] = time.time() + get_settings().read_your_writes_seconds
+		client["wrote"] = True
+
+def has_recent_write(*user_ids) -> bool:
+	client = _client_writes.get()
+	if client is not None and client["until"] > time.time():
+		return True
+	now = time.monotonic()
+	with _recent_writes_lock:
+		for user_id in user_ids:
+			if not user_id:
+				continue
+			expires_at = _recent_writes.get(str(user_id))
+			if expires_at is None:
+				continue
+			if expires_at > now:
+				return True
+			del _recent_writes[str(user_id)]
+	return False
+
+# Return a client for read-only queries. Reads are spread over the configured
+# replicas, except for users that wrote recently and clients inside their
+# read-your-writes window: they are served by the primary so they see their
+# own changes despite replication lag. Replicas whose breaker is open are
+# skipped, the primary serves when all of them are.
+def get_read_client(*user_ids) -> "Client":
+	replicas = _get_replicas()
+	if not replicas or has_recent_write(*user_ids):
+		return get_supabase()
+	with _client_lock:
+		for _ in replicas:
+			replica, breaker = next(_replica_cycle)
+			if not breaker.is_open:
+				return replica
+	return get_supabase()
+
+# The end of the read-your-writes window sent by the client, 0 without one
+def _client_window(scope) -> float:
+	value = None
+	for name, header in scope.get("headers", ()):
+		if name == READ_YOUR_WRITES_HEADER:
+			value = header.decode("latin-1")
+		elif name == b"cookie" and value is None:
+			for cookie in header.decode("latin-1").split(";"):
+				key, _, cookie_value = cookie.strip().partition("=")
+				if key == READ_YOUR_WRITES_COOKIE:
+					value = cookie_value
+	try:
+		until = float(value) if value else 0.0
+	except ValueError:
+		return 0.0
+	# A forged far future window only sends that client's reads to the primary,
+	# but is still capped to one window from now
+	return min(until, time.time() + get_settings().read_your_writes_seconds)
+
+# ASGI middleware carrying read-your-writes windows between workers: reads of
+# a client inside its window go to the primary on every worker, and responses
+# to requests that wrote hand the client a new window
+class ReadYourWritesMiddleware:
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			return await self.app(scope, receive, send)
+		client = {"until": _client_window(scope), "wrote": False}
+		token = _client_writes.set(client)
+
+		async def send_wrapper(message):
+			if message["type"] == "http.response.start" and client["wrote"]:
+				until = f"{client['until']:.3f}"
+				max_age = math.ceil(get_settings().read_your_writes_seconds)
+				message["headers"] = [
+					*message.get("headers", []),
+					(b"set-cookie", f"{READ_YOUR_WRITES_COOKIE}={until}; Max-Age={max_age}; Path=/; HttpOnly; SameSite=Lax".encode()),
+					(READ_YOUR_WRITES_HEADER, until.encode()),
+				]
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			_client_writes.reset(token)
+
+# Issue a cheap query so the HTTP connection pools are open before traffic arrives
+def warmup_supabase():
+	for client in [get_supabase(), *_get_replicas()]:
+		client.table("users").select(EXISTENCE_COLUMNS).limit(1).execute()
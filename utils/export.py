@@ -0,0 +1,59 @@
+from typing import Iterator, Optional
+from utils.columns import TWEET_ROW_COLUMNS, LIKE_ROW_COLUMNS, FOLLOW_ROW_COLUMNS
+from utils.resilience import uncached_reads
+import json
+import zlib
+
+# What an export can contain: record type -> (table, columns, column holding the user id)
+EXPORT_SOURCES = {
+	"tweet": ("tweets", TWEET_ROW_COLUMNS, "user_id"),
+	"like": ("tweet_likes", LIKE_ROW_COLUMNS, "user_id"),
+	"follower": ("user_followers", FOLLOW_ROW_COLUMNS, "user_id"),
+	"following": ("user_followers", FOLLOW_ROW_COLUMNS, "follower_id"),
+}
+
+# Rows of table belonging to user, oldest first, read in keyset pages of
+# chunk_size over (created_at, id) so memory use does not grow with the user's
+# history. Each page is a separate query, not a consistent snapshot.
+def fetch_chunks(supabase, table: str, columns: str, user_column: str, user_id: str,
+		since: Optional[str] = None, chunk_size: int = 1000) -> Iterator[list[dict]]:
+	last = None
+	while True:
+		query = supabase \
+			.from_(table) \
+			.select(columns) \
+			.eq(user_column, user_id)
+		if since:
+			query = query.gte("created_at", since)
+		if last:
+			query = query.or_(f'created_at.gt."{last["created_at"]}",and(created_at.eq."{last["created_at"]}",id.gt.{last["id"]})')
+		# Pages are read once, they are not worth keeping for stale reads
+		with uncached_reads():
+			rows = query \
+				.order("created_at") \
+				.order("id") \
+				.limit(chunk_size) \
+				.execute() \
+				.data
+		if rows:
+			yield rows
+		if len(rows) < chunk_size:
+			return
+		last = rows[-1]
+
+# A user's records as NDJSON, one {"type": ..., **row} object per line and one
+# bytes block per database page. Records created before since are skipped.
+def export_user(supabase, user_id: str, types: list[str], since: Optional[str] = None, chunk_size: int = 1000) -> Iterator[bytes]:
+	for type in types:
+		table, columns, user_column = EXPORT_SOURCES[type]
+		for rows in fetch_chunks(supabase, table, columns, user_column, user_id, since, chunk_size):
+			yield "".join(json.dumps({"type": type, **row}, default=str) + "\n" for row in rows).encode()
+
+# Compress a stream of blocks into one gzip stream, block by block
+def gzip_stream(blocks: Iterator[bytes]) -> Iterator[bytes]:
+	compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+	for block in blocks:
+		compressed = compressor.compress(block)
+		if compressed:
+			yield compressed
+	yield compressor.flush()
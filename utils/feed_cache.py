@@ -0,0 +1,91 @@
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+from models.Tweet import TweetResponse
+from utils.database import get_supabase, get_read_client
+from utils.columns import TWEET_COLUMNS
+from utils.tweets import hydrate_tweets
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# In-memory snapshot of the newest tweets of the global feed, shared by every
+# viewer. It holds the first `size` tweets with and without retweets, is
+# rebuilt every `interval` seconds and as soon as a tweet is created or deleted.
+# Viewer specific fields (is_liked) are applied per request on top of it.
+class FeedSnapshot:
+	def __init__(self, size: int = 50, interval: float = 5.0):
+		self.size = size
+		self.interval = interval
+		self._feeds: dict[bool, list[TweetResponse]] = {}
+		self._generation = 0
+		# Whether a write invalidated the snapshot since the last rebuild
+		self._invalidated = False
+		self._changed = asyncio.Event()
+		self.primed = asyncio.Event()
+		# The loop run() waits on, set from threads through call_soon_threadsafe
+		self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+	def configure(self, size: int, interval: float):
+		self.size = size
+		self.interval = interval
+
+	# Return the requested slice, or None when it is not covered by the snapshot
+	def get(self, no_retweets: bool, offset: int, limit: int) -> Optional[list[TweetResponse]]:
+		tweets = self._feeds.get(no_retweets)
+		if tweets is None or offset < 0 or offset + limit > self.size:
+			return None
+		return tweets[offset:offset + limit]
+
+	# Drop the snapshot and wake the refresh loop. Until the rebuild finishes
+	# requests fall back to querying the database, so writers see their change.
+	# Safe to call from threadpool code such as background tasks.
+	def invalidate(self):
+		self._generation += 1
+		self._feeds = {}
+		self._invalidated = True
+		try:
+			running = asyncio.get_running_loop()
+		except RuntimeError:
+			running = None
+		if self._loop is None or running is self._loop:
+			self._changed.set()
+		else:
+			self._loop.call_soon_threadsafe(self._changed.set)
+
+	# Rebuild the snapshot. After a write it is read from the primary, as a
+	# lagging replica could miss the change and the snapshot would hide it
+	# until the next periodic refresh.
+	def refresh(self, from_primary: bool = False):
+		supabase = get_supabase() if from_primary else get_read_client()
+		generation = self._generation
+		feeds = {}
+		for no_retweets in (False, True):
+			query = supabase \
+				.from_("tweets") \
+				.select(TWEET_COLUMNS) \
+				.order("created_at", desc=True) \
+				.range(0, self.size - 1)
+			if no_retweets:
+				query = query.is_("retweet_id", None)
+			feeds[no_retweets] = hydrate_tweets(supabase, query.execute().data)
+		# Discard the result if a write invalidated the feed while it was built
+		if generation == self._generation:
+			self._feeds = feeds
+
+	async def run(self):
+		self._loop = asyncio.get_running_loop()
+		while True:
+			self._changed.clear()
+			from_primary, self._invalidated = self._invalidated, False
+			try:
+				await run_in_threadpool(self.refresh, from_primary)
+				self.primed.set()
+			except Exception:
+				logger.exception("Failed to refresh the feed snapshot")
+			try:
+				await asyncio.wait_for(self._changed.wait(), timeout=self.interval)
+			except asyncio.TimeoutError:
+				pass
+
+feed_snapshot = FeedSnapshot()
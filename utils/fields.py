@@ -0,0 +1,32 @@
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from typing import Optional
+
+# Parse a comma separated `fields` query parameter into the set of computed
+# fields to hydrate. No parameter means every field, an empty one means none.
+def parse_fields(fields: Optional[str], allowed: frozenset) -> frozenset:
+	if fields is None:
+		return allowed
+	requested = frozenset(field.strip() for field in fields.split(",") if field.strip())
+	unknown = requested - allowed
+	if unknown:
+		raise HTTPException(
+			status_code=400,
+			detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(sorted(allowed))}"
+		)
+	return requested
+
+# Serialize models without the computed fields that were not requested.
+# Models are returned untouched when every field was requested.
+def select_fields(items: list, fields: frozenset, allowed: frozenset) -> list:
+	omitted = allowed - fields
+	if not omitted:
+		return items
+	return [item.model_dump(mode="json", exclude=omitted) for item in items]
+
+# Single item variant for routes with a response_model, which would otherwise
+# serialize the omitted fields back as null
+def select_item_fields(item, fields: frozenset, allowed: frozenset):
+	if not allowed - fields:
+		return item
+	return JSONResponse(content=select_fields([item], fields, allowed)[0])
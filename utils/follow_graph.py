@@ -0,0 +1,238 @@
+from fastapi.concurrency import run_in_threadpool
+from array import array
+from collections import defaultdict
+from threading import Lock
+from typing import Iterable, Optional
+from utils.database import get_read_client
+from utils.resilience import uncached_reads
+import asyncio
+import heapq
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+# Score added when the candidate already follows the user
+FOLLOWS_YOU_SCORE = 2
+
+# Compressed sparse row adjacency: the neighbours of node i are
+# targets[offsets[i]:offsets[i + 1]]
+class _CSR:
+	__slots__ = ("offsets", "targets")
+
+	def __init__(self, node_count: int, sources: array, targets: array):
+		offsets = array("I", bytes(4 * (node_count + 1)))
+		for source in sources:
+			offsets[source + 1] += 1
+		for i in range(node_count):
+			offsets[i + 1] += offsets[i]
+
+		positions = array("I", offsets)
+		ordered = array("I", bytes(4 * len(targets)))
+		for source, target in zip(sources, targets):
+			ordered[positions[source]] = target
+			positions[source] += 1
+
+		self.offsets = offsets
+		self.targets = ordered
+
+	def neighbours(self, node: int):
+		if node + 1 >= len(self.offsets):
+			return ()
+		return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+# In-memory index of user_followers used for who-to-follow suggestions.
+# User UUIDs are mapped to dense integers and edges are stored as CSR arrays
+# in both directions. Follows and un-follows made through this worker are
+# kept in small overlay sets until the next full reload.
+class FollowGraph:
+	def __init__(self):
+		self._lock = Lock()
+		self._ids: dict[str, int] = {}
+		self._uuids: list[str] = []
+		self._following: Optional[_CSR] = None
+		self._followers: Optional[_CSR] = None
+		self._added: set[tuple[int, int]] = set()
+		self._removed: set[tuple[int, int]] = set()
+		self._added_following = defaultdict(set)
+		self._added_followers = defaultdict(set)
+		# Changes seen while a reload is running, replayed on the new index
+		self._replay: Optional[list[tuple[bool, str, str]]] = None
+
+	@property
+	def loaded(self) -> bool:
+		return self._following is not None
+
+	@property
+	def edge_count(self) -> int:
+		if not self.loaded:
+			return 0
+		return len(self._following.targets) + len(self._added) - len(self._removed)
+
+	# Build the index from (follower_id, user_id) pairs
+	def build(self, edges: Iterable[tuple[str, str]]):
+		with self._lock:
+			self._replay = []
+		try:
+			ids: dict[str, int] = {}
+			uuids: list[str] = []
+			sources = array("I")
+			targets = array("I")
+			for follower_id, user_id in edges:
+				for uuid in (follower_id, user_id):
+					if uuid not in ids:
+						ids[uuid] = len(uuids)
+						uuids.append(uuid)
+				sources.append(ids[follower_id])
+				targets.append(ids[user_id])
+
+			following = _CSR(len(uuids), sources, targets)
+			followers = _CSR(len(uuids), targets, sources)
+			del sources, targets
+		except BaseException:
+			with self._lock:
+				self._replay = None
+			raise
+
+		with self._lock:
+			self._ids, self._uuids = ids, uuids
+			self._following, self._followers = following, followers
+			self._added, self._removed = set(), set()
+			self._added_following, self._added_followers = defaultdict(set), defaultdict(set)
+			replay, self._replay = self._replay, None
+			for follow, follower_id, user_id in replay:
+				self._apply(follow, follower_id, user_id)
+
+	# Load every edge of user_followers in keyset pages
+	def load(self, supabase, page_size: int = 1000):
+		self.build(_fetch_edges(supabase, page_size))
+		logger.info("Follow graph loaded: %d users, %d edges", len(self._uuids), self.edge_count)
+
+	# Reload the whole index periodically to pick up changes made elsewhere
+	async def run(self, interval: float):
+		while True:
+			try:
+				await run_in_threadpool(self.load, get_read_client())
+			except Exception:
+				logger.exception("Failed to load the follow graph")
+			await asyncio.sleep(interval)
+
+	def add_edge(self, follower_id, user_id):
+		self._change(True, str(follower_id), str(user_id))
+
+	def remove_edge(self, follower_id, user_id):
+		self._change(False, str(follower_id), str(user_id))
+
+	def _change(self, follow: bool, follower_id: str, user_id: str):
+		with self._lock:
+			if self._replay is not None:
+				self._replay.append((follow, follower_id, user_id))
+			if self.loaded:
+				self._apply(follow, follower_id, user_id)
+
+	def _node(self, uuid: str) -> int:
+		node = self._ids.get(uuid)
+		if node is None:
+			node = self._ids[uuid] = len(self._uuids)
+			self._uuids.append(uuid)
+		return node
+
+	def _in_csr(self, follower: int, user: int) -> bool:
+		return user in self._following.neighbours(follower)
+
+	def _apply(self, follow: bool, follower_id: str, user_id: str):
+		edge = (self._node(follower_id), self._node(user_id))
+		if follow:
+			self._removed.discard(edge)
+			if not self._in_csr(*edge):
+				self._added.add(edge)
+				self._added_following[edge[0]].add(edge[1])
+				self._added_followers[edge[1]].add(edge[0])
+		else:
+			if edge in self._added:
+				self._added.discard(edge)
+				self._added_following[edge[0]].discard(edge[1])
+				self._added_followers[edge[1]].discard(edge[0])
+			elif self._in_csr(*edge):
+				self._removed.add(edge)
+
+	def _following_of(self, node: int):
+		for target in self._following.neighbours(node):
+			if (node, target) not in self._removed:
+				yield target
+		yield from self._added_following.get(node, ())
+
+	def _followers_of(self, node: int):
+		for source in self._followers.neighbours(node):
+			if (source, node) not in self._removed:
+				yield source
+		yield from self._added_followers.get(node, ())
+
+	# Rank accounts the user does not follow yet. Each account followed by
+	# someone the user follows scores one point per such path (mutual_count),
+	# accounts that already follow the user get FOLLOWS_YOU_SCORE on top.
+	# max_fanout caps how many followings of each friend are scanned, which
+	# bounds the cost for users following very large accounts. Users following
+	# more than max_friends accounts are scored from a random sample of them,
+	# and the scan stops after max_scanned edges in total, as it holds the lock
+	# add_edge and remove_edge wait on.
+	def suggestions(self, user_id, limit: int = 10, max_fanout: int = 5000,
+			max_friends: int = 500, max_scanned: int = 200_000) -> list[dict]:
+		with self._lock:
+			node = self._ids.get(str(user_id))
+			if node is None:
+				return []
+			following = set(self._following_of(node))
+			followers = set(self._followers_of(node))
+
+			friends = following
+			if len(friends) > max_friends:
+				friends = random.sample(sorted(friends), max_friends)
+			mutual_counts: dict[int, int] = defaultdict(int)
+			scanned = 0
+			for friend in friends:
+				fanout = 0
+				for candidate in self._following_of(friend):
+					mutual_counts[candidate] += 1
+					fanout += 1
+					if fanout >= max_fanout:
+						break
+				scanned += fanout
+				if scanned >= max_scanned:
+					break
+
+			candidates = (set(mutual_counts) | followers) - following - {node}
+			scored = (
+				(mutual_counts.get(candidate, 0) + (FOLLOWS_YOU_SCORE if candidate in followers else 0), candidate)
+				for candidate in candidates
+			)
+			top = heapq.nlargest(limit, scored)
+			return [
+				{
+					"user_id": self._uuids[candidate],
+					"score": score,
+					"mutual_count": mutual_counts.get(candidate, 0),
+					"follows_you": candidate in followers
+				}
+				for score, candidate in top
+			]
+
+def _fetch_edges(supabase, page_size: int):
+	last_id = None
+	while True:
+		query = supabase \
+			.from_("user_followers") \
+			.select("id, user_id, follower_id") \
+			.order("id") \
+			.limit(page_size)
+		if last_id is not None:
+			query = query.gt("id", last_id)
+		with uncached_reads():
+			rows = query.execute().data
+		for row in rows:
+			yield row["follower_id"], row["user_id"]
+		if len(rows) < page_size:
+			return
+		last_id = rows[-1]["id"]
+
+follow_graph = FollowGraph()
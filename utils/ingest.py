@@ -0,0 +1,178 @@
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+from pydantic import ValidationError
+from models.Tweet import TweetImport
+from utils.columns import EXISTENCE_COLUMNS
+from utils.known_ids import KnownIds, known_users, known_tweets
+import hashlib
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Longest accepted NDJSON line, in bytes
+MAX_LINE_BYTES = 64 * 1024
+
+# Ids per in_() filter, keeping the request URL short
+LOOKUP_CHUNK_SIZE = 200
+
+# Longest accepted import_id
+MAX_IMPORT_ID_LENGTH = 200
+
+# Namespace of the ids derived for imported rows without one
+IMPORT_NAMESPACE = uuid.UUID("6f1c2a0e-4b7d-5e3a-9c8f-2d4e6a8b0c1d")
+
+# Columns of an import's saved progress
+IMPORT_PROGRESS_COLUMNS = "committed_line, inserted, duplicates, rejected"
+
+# Split a streamed request body into (line number, line), numbered from 1.
+# Blank lines are skipped, lines longer than MAX_LINE_BYTES are returned as
+# None so they can be reported without being buffered.
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, Optional[bytes]]]:
+	buffer = b""
+	number = 0
+	too_long = False
+	async for chunk in chunks:
+		buffer += chunk
+		*lines, buffer = buffer.split(b"\n")
+		for line in lines:
+			number += 1
+			if too_long or len(line) > MAX_LINE_BYTES:
+				too_long = False
+				yield number, None
+			elif line.strip():
+				yield number, line
+		if len(buffer) > MAX_LINE_BYTES:
+			too_long = True
+			buffer = b""
+	if too_long or buffer.strip():
+		yield number + 1, None if too_long else buffer
+
+# Validate one NDJSON line into a tweet row ready to insert, or raise ValueError.
+# Rows without an id get one derived from import_id, the line number and the
+# line, so sending the same file again yields the same ids. import_id must
+# be unique per source file, without one the ids are random.
+def parse_row(line: Optional[bytes], number: int, import_id: Optional[str] = None) -> dict:
+	if line is None:
+		raise ValueError(f"Line longer than {MAX_LINE_BYTES} bytes")
+	try:
+		data = json.loads(line)
+	except ValueError:
+		raise ValueError("Invalid JSON")
+	if not isinstance(data, dict):
+		raise ValueError("Expected a JSON object")
+	try:
+		tweet = TweetImport(**data)
+	except ValidationError as e:
+		raise ValueError("; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+	row = tweet.model_dump(mode="json", exclude_none=True)
+	if "id" in row:
+		pass
+	elif import_id:
+		digest = hashlib.sha256(line).hexdigest()
+		row["id"] = str(uuid.uuid5(IMPORT_NAMESPACE, f"{import_id}:{number}:{digest}"))
+	else:
+		row["id"] = str(uuid.uuid4())
+	return row
+
+# Which of ids exist in table, querying the unknown ones in chunks. Ids known
+# to be missing are never queried. Ids known to exist are only skipped with
+# trust_positive, as in check_exists: a Bloom filter false positive would
+# fail the insert of a row referencing it.
+def find_existing(supabase, table: str, known: KnownIds, ids: set[str], trust_positive: bool = True) -> set[str]:
+	existing = set()
+	unknown = []
+	for id in sorted(ids):
+		exists = known.lookup(id)
+		if exists and trust_positive:
+			existing.add(id)
+		elif exists is not False:
+			unknown.append(id)
+	for start in range(0, len(unknown), LOOKUP_CHUNK_SIZE):
+		chunk = unknown[start:start + LOOKUP_CHUNK_SIZE]
+		response = supabase \
+			.from_(table) \
+			.select(EXISTENCE_COLUMNS) \
+			.in_("id", chunk) \
+			.execute()
+		found = {row["id"] for row in response.data}
+		known.add(*found)
+		existing |= found
+	return existing
+
+# Insert a batch of (line number, row) pairs. Authors and retweet_id targets
+# are resolved for the whole batch first, targets may be earlier rows of the
+# same batch. Returns the inserted line numbers, the line numbers of rows
+# already stored and {line number: error}.
+def insert_batch(supabase, batch: list[tuple[int, dict]]) -> tuple[list[int], list[int], dict[int, str]]:
+	errors = {}
+	# The rows reference both, so positives are checked
+	users = find_existing(supabase, "users", known_users, {row["user_id"] for _, row in batch}, trust_positive=False)
+	batch_ids = set()
+	parent_ids = set()
+	for _, row in batch:
+		if row.get("retweet_id") and row["retweet_id"] not in batch_ids:
+			parent_ids.add(row["retweet_id"])
+		batch_ids.add(row["id"])
+	parents = find_existing(supabase, "tweets", known_tweets, parent_ids, trust_positive=False)
+
+	rows = []
+	accepted_ids = set()
+	for number, row in batch:
+		if row["user_id"] not in users:
+			errors[number] = "user_id does not exist"
+		elif row.get("retweet_id") and row["retweet_id"] not in parents and row["retweet_id"] not in accepted_ids:
+			errors[number] = "retweet_id does not exist"
+		else:
+			rows.append((number, row))
+			accepted_ids.add(row["id"])
+	if not rows:
+		return [], [], errors
+
+	# Rows already stored with the same id are skipped, so an interrupted
+	# ingest can be sent again. Only the rows written are returned.
+	try:
+		response = supabase \
+			.from_("tweets") \
+			.upsert([row for _, row in rows], on_conflict="id", ignore_duplicates=True, default_to_null=False) \
+			.select(EXISTENCE_COLUMNS) \
+			.execute()
+		written = {tweet["id"] for tweet in response.data}
+		stored = rows
+	except Exception:
+		# Find the failing rows by inserting one at a time
+		logger.warning("Bulk insert of %d tweets failed, inserting them one by one", len(rows), exc_info=True)
+		written = set()
+		stored = []
+		for number, row in rows:
+			try:
+				response = supabase \
+					.from_("tweets") \
+					.upsert(row, on_conflict="id", ignore_duplicates=True, default_to_null=False) \
+					.select(EXISTENCE_COLUMNS) \
+					.execute()
+				written |= {tweet["id"] for tweet in response.data}
+				stored.append((number, row))
+			except Exception as e:
+				errors[number] = str(e)
+
+	known_tweets.add(*(row["id"] for _, row in stored))
+	inserted = [number for number, row in stored if row["id"] in written]
+	duplicates = [number for number, row in stored if row["id"] not in written]
+	return inserted, duplicates, errors
+
+# Saved progress of an import, None for an unknown import_id
+def load_progress(supabase, import_id: str) -> Optional[dict]:
+	response = supabase \
+		.from_("tweet_imports") \
+		.select(IMPORT_PROGRESS_COLUMNS) \
+		.eq("id", import_id) \
+		.execute()
+	return response.data[0] if response.data else None
+
+def save_progress(supabase, import_id: str, progress: dict):
+	supabase \
+		.from_("tweet_imports") \
+		.upsert({"id": import_id, **progress, "updated_at": datetime.now(timezone.utc).isoformat()}, returning="minimal") \
+		.execute()
@@ -0,0 +1,140 @@
+from utils.columns import EXISTENCE_COLUMNS
+from utils.resilience import uncached_reads
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+import hashlib
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+# Fixed size set membership with false positives but no false negatives
+class BloomFilter:
+	def __init__(self, capacity: int, error_rate: float):
+		self.capacity = capacity
+		self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+		self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+		self.bits = bytearray(math.ceil(self.size / 8))
+		self.count = 0
+
+	def _positions(self, key: str):
+		digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+		first = int.from_bytes(digest[:8], "little")
+		second = int.from_bytes(digest[8:], "little") | 1
+		for i in range(self.hash_count):
+			yield (first + i * second) % self.size
+
+	def add(self, key: str):
+		for position in self._positions(key):
+			self.bits[position >> 3] |= 1 << (position & 7)
+		self.count += 1
+
+	def __contains__(self, key: str) -> bool:
+		return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+	def clear(self):
+		self.bits = bytearray(len(self.bits))
+		self.count = 0
+
+# Per-worker record of which ids of a table exist, to skip existence queries.
+#
+# Ids seen to exist (read, inserted) go into a Bloom filter. Ids seen to be
+# missing go into a small LRU negative cache: for negative_ttl seconds when a
+# lookup found nothing, as the row may since have been created by another
+# worker, and for good when this worker deleted the row, since UUIDs are not
+# reused. The negative cache is checked first, so deleted ids that are still
+# set in the Bloom filter read as missing.
+#
+# lookup() answers True (probably exists), False (missing) or None (unknown,
+# ask the database). True can be a false positive at error_rate, so callers
+# only use it where a wrong answer is harmless, such as returning an empty
+# page instead of a 404.
+class KnownIds:
+	def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001, negative_ttl: float = 30.0, negative_size: int = 10000):
+		self._present = BloomFilter(capacity, error_rate)
+		self._missing: OrderedDict[str, float] = OrderedDict()
+		self._negative_ttl = negative_ttl
+		self._negative_size = negative_size
+		self._lock = Lock()
+
+	def lookup(self, id) -> Optional[bool]:
+		key = str(id)
+		with self._lock:
+			expires_at = self._missing.get(key)
+			if expires_at is not None:
+				if expires_at > time.monotonic():
+					return False
+				del self._missing[key]
+			if key in self._present:
+				return True
+		return None
+
+	def add(self, *ids):
+		with self._lock:
+			for id in ids:
+				key = str(id)
+				self._missing.pop(key, None)
+				# Hot ids are recorded on every read, only new ones fill the filter
+				if key in self._present:
+					continue
+				if self._present.count >= self._present.capacity:
+					# Past capacity the error rate climbs, start over
+					logger.info("Known id filter reached %d ids, clearing it", self._present.count)
+					self._present.clear()
+				self._present.add(key)
+
+	# A lookup found no row with this id
+	def mark_missing(self, id):
+		self._remember_missing(str(id), time.monotonic() + self._negative_ttl)
+
+	# This worker deleted the row with this id
+	def discard(self, id):
+		self._remember_missing(str(id), math.inf)
+
+	def _remember_missing(self, key: str, expires_at: float):
+		with self._lock:
+			self._missing[key] = expires_at
+			self._missing.move_to_end(key)
+			while len(self._missing) > self._negative_size:
+				self._missing.popitem(last=False)
+
+	def record(self, id, exists: bool):
+		if exists:
+			self.add(id)
+		else:
+			self.mark_missing(id)
+
+known_users = KnownIds()
+known_tweets = KnownIds()
+
+# Whether a row with this id exists in table, answered from known when
+# possible and otherwise with an id-only query whose result is remembered.
+# With trust_positive=False only "missing" is answered from known, for
+# callers that need proof of existence, such as a write referencing the row.
+def check_exists(supabase, table: str, known: KnownIds, id, trust_positive: bool = True) -> bool:
+	exists = known.lookup(id)
+	if exists is False or (exists and trust_positive):
+		return exists
+	response = supabase.table(table).select(EXISTENCE_COLUMNS).eq("id", str(id)).execute()
+	exists = bool(response.data)
+	known.record(id, exists)
+	return exists
+
+# Fill known with every id of table, in keyset pages, kept out of the stale cache
+def preload_ids(supabase, table: str, known: KnownIds, page_size: int = 1000, limit: int = 1_000_000):
+	last_id = None
+	loaded = 0
+	while loaded < limit:
+		query = supabase.table(table).select(EXISTENCE_COLUMNS).order("id").limit(page_size)
+		if last_id is not None:
+			query = query.gt("id", last_id)
+		with uncached_reads():
+			rows = query.execute().data
+		known.add(*(row["id"] for row in rows))
+		loaded += len(rows)
+		if len(rows) < page_size:
+			break
+		last_id = rows[-1]["id"]
+	return loaded
@@ -0,0 +1,198 @@
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Optional
+from uuid import UUID
+from models.Notification import NotificationActor, NotificationResponse
+from utils.columns import ACTOR_COLUMNS
+from utils.database import get_supabase
+import asyncio
+import base64
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Actors listed per notification, further ones only count towards actor_count
+MAX_ACTORS = 50
+
+# Actors returned with each notification
+PREVIEW_ACTORS = 3
+
+# Buffers like, follow and reply events and writes them in the background.
+#
+# Handlers only call notify(), which coalesces the event in memory with the
+# pending events of the same user, type and tweet. run() flushes the pending
+# notifications every `interval` seconds, or as soon as `batch_size` are
+# waiting, through add_notifications (see supabase/migrations), which merges
+# them into the user's unread notification of the same target in the database.
+# At most `max_pending` notifications wait, further events are dropped.
+# Batches that fail to be written are merged back into the pending ones for
+# the next flush, within the same limit.
+class NotificationQueue:
+	def __init__(self, batch_size: int = 500, interval: float = 2.0, max_pending: int = 10000):
+		# Events are ignored until configure() is called, when notifications are enabled
+		self.enabled = False
+		self.batch_size = batch_size
+		self.interval = interval
+		self.max_pending = max_pending
+		# (user_id, type, tweet_id) -> {"actor_ids": newest first, "actor_count", "at": latest event}
+		self._pending: dict[tuple, dict] = {}
+		self._lock = Lock()
+		self._full = asyncio.Event()
+		self.dropped = 0
+
+	def configure(self, batch_size: int, interval: float, max_pending: int):
+		self.enabled = True
+		self.batch_size = batch_size
+		self.interval = interval
+		self.max_pending = max_pending
+
+	def notify(self, type: str, user_id, actor_id, tweet_id=None):
+		# Nobody is notified of their own actions
+		if not self.enabled or str(user_id) == str(actor_id):
+			return
+		key = (str(user_id), type, str(tweet_id) if tweet_id else None)
+		actor_id = str(actor_id)
+		with self._lock:
+			pending = self._pending.get(key)
+			if pending is None:
+				if len(self._pending) >= self.max_pending:
+					self.dropped += 1
+					return
+				pending = self._pending[key] = {"actor_ids": [], "actor_count": 0, "at": None}
+			if actor_id in pending["actor_ids"]:
+				pending["actor_ids"].remove(actor_id)
+			else:
+				pending["actor_count"] += 1
+			pending["actor_ids"].insert(0, actor_id)
+			del pending["actor_ids"][MAX_ACTORS:]
+			pending["at"] = datetime.now(timezone.utc).isoformat()
+			if len(self._pending) >= self.batch_size:
+				self._full.set()
+
+	def _take(self) -> list[dict]:
+		with self._lock:
+			pending, self._pending = self._pending, {}
+			self._full.clear()
+		return [
+			{"user_id": user_id, "type": type, "tweet_id": tweet_id, **notification}
+			for (user_id, type, tweet_id), notification in pending.items()
+		]
+
+	# Put back a notification that failed to be written. Events queued since
+	# then are newer, so their actors stay first.
+	def _restore(self, notification: dict):
+		key = (notification["user_id"], notification["type"], notification["tweet_id"])
+		pending = self._pending.get(key)
+		if pending is None:
+			if len(self._pending) >= self.max_pending:
+				self.dropped += notification["actor_count"]
+				return
+			self._pending[key] = {
+				"actor_ids": notification["actor_ids"],
+				"actor_count": notification["actor_count"],
+				"at": notification["at"]
+			}
+			return
+		older = [actor_id for actor_id in notification["actor_ids"] if actor_id not in pending["actor_ids"]]
+		# Listed actors in both are counted once
+		pending["actor_count"] += notification["actor_count"] - (len(notification["actor_ids"]) - len(older))
+		pending["actor_ids"] = (pending["actor_ids"] + older)[:MAX_ACTORS]
+
+	# Write every pending notification, batch_size per round trip
+	def flush(self):
+		notifications = self._take()
+		for start in range(0, len(notifications), self.batch_size):
+			batch = notifications[start:start + self.batch_size]
+			try:
+				get_supabase().rpc("add_notifications", {"notifications": batch}).execute()
+			except Exception:
+				logger.exception("Failed to write %d notifications, keeping them for the next flush", len(batch))
+				with self._lock:
+					for notification in batch:
+						self._restore(notification)
+		if self.dropped:
+			logger.warning("Dropped %d notification events, the queue was full", self.dropped)
+			self.dropped = 0
+
+	async def run(self):
+		while True:
+			try:
+				await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+			except asyncio.TimeoutError:
+				pass
+			try:
+				await run_in_threadpool(self.flush)
+			except Exception:
+				logger.exception("Failed to flush notifications")
+
+notification_queue = NotificationQueue()
+
+# Text of a notification, naming its most recent actor
+def describe_notification(type: str, actor_names: list[str], actor_count: int) -> str:
+	if not actor_names:
+		who = f"{actor_count} people" if actor_count != 1 else "Someone"
+	elif actor_count == 1:
+		who = actor_names[0]
+	elif actor_count == 2 and len(actor_names) > 1:
+		who = f"{actor_names[0]} and {actor_names[1]}"
+	else:
+		others = actor_count - 1
+		who = f"{actor_names[0]} and {others} other{'s' if others > 1 else ''}"
+
+	if type == "like":
+		return f"{who} liked your tweet"
+	if type == "reply":
+		return f"{who} replied to your tweet"
+	return f"{who} followed you"
+
+# Build NotificationResponse objects for notification rows, fetching the
+# previewed actors of the whole page in one query
+def hydrate_notifications(supabase, rows) -> list[NotificationResponse]:
+	actor_ids = list({actor_id for row in rows for actor_id in row["actor_ids"][:PREVIEW_ACTORS]})
+	actors_by_id = {}
+	if actor_ids:
+		actors_response = supabase \
+			.from_("users") \
+			.select(ACTOR_COLUMNS) \
+			.in_("id", actor_ids) \
+			.execute()
+		actors_by_id = {actor["id"]: NotificationActor(**actor) for actor in actors_response.data}
+
+	notifications = []
+	for row in rows:
+		# Deleted users drop out of the preview
+		actors = [actors_by_id[actor_id] for actor_id in row["actor_ids"][:PREVIEW_ACTORS] if actor_id in actors_by_id]
+		notifications.append(NotificationResponse(
+			id=row["id"],
+			type=row["type"],
+			tweet_id=row["tweet_id"],
+			actors=actors,
+			actor_count=row["actor_count"],
+			message=describe_notification(row["type"], [actor.username for actor in actors], row["actor_count"]),
+			read=row["read"],
+			created_at=row["created_at"],
+			updated_at=row["updated_at"]
+		))
+	return notifications
+
+# Opaque cursor for keyset pagination over (updated_at desc, id desc),
+# pointing after the given notification
+def encode_cursor(notification: dict) -> str:
+	position = f"{notification['updated_at']}|{notification['id']}"
+	return base64.urlsafe_b64encode(position.encode()).decode()
+
+# The position in a cursor, None when it is not a timestamp and a UUID. Both
+# are returned normalized, as they are pasted into a PostgREST filter.
+def decode_cursor(cursor: str) -> Optional[tuple[str, str]]:
+	try:
+		position = base64.urlsafe_b64decode(cursor.encode()).decode()
+	except (ValueError, UnicodeDecodeError):
+		return None
+	updated_at, separator, id = position.partition("|")
+	if not separator:
+		return None
+	try:
+		return datetime.fromisoformat(updated_at).isoformat(), str(UUID(id))
+	except ValueError:
+		return None
@@ -0,0 +1,127 @@
+from utils.config import get_settings
+from datetime import datetime, timezone
+from typing import Optional
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile-token"
+
+try:
+	from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+	SamplingProfiler = None
+
+# Written into the metadata of profiles taken without pyinstrument
+CPROFILE_WARNING = ("pyinstrument is not installed, profiled with cProfile: every call is traced, "
+	"inflating the timings, and coroutines of concurrent requests are mixed in")
+
+# ASGI middleware running selected requests under a profiler.
+#
+# Nothing happens unless PROFILING is enabled. Then a PROFILING_SAMPLE_RATE
+# fraction of requests is profiled, plus every request sending an
+# X-Profile-Token header equal to PROFILING_TOKEN. Results are written to
+# PROFILING_DIR: an HTML flame graph from pyinstrument (a sampling profiler,
+# in requirements.txt), each with a .json file holding the route and
+# duration. Without pyinstrument a cProfile .pstats file is written instead,
+# with a warning logged and recorded in the metadata.
+class ProfilingMiddleware:
+	def __init__(self, app):
+		self.app = app
+		# Profilers hook the whole interpreter, so one request at a time
+		self._active = False
+		self._warned = False
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			return await self.app(scope, receive, send)
+		settings = get_settings()
+		if not settings.profiling:
+			return await self.app(scope, receive, send)
+
+		trigger = self._trigger(scope, settings)
+		if not trigger or self._active:
+			return await self.app(scope, receive, send)
+		self._active = True
+
+		profile_id = uuid.uuid4().hex
+		status = {}
+
+		async def send_wrapper(message):
+			if message["type"] == "http.response.start":
+				status["code"] = message["status"]
+				message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+			await send(message)
+
+		if not SamplingProfiler and not self._warned:
+			logger.warning("Profiling with cProfile: %s", CPROFILE_WARNING)
+			self._warned = True
+		profiler = SamplingProfiler(async_mode="enabled") if SamplingProfiler else cProfile.Profile()
+		started = time.perf_counter()
+		if SamplingProfiler:
+			profiler.start()
+		else:
+			profiler.enable()
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			if SamplingProfiler:
+				profiler.stop()
+			else:
+				profiler.disable()
+			duration = time.perf_counter() - started
+			self._active = False
+			try:
+				self._save(settings.profiling_dir, profile_id, profiler, scope, status.get("code"), duration, trigger)
+			except Exception:
+				logger.exception("Failed to save profile %s", profile_id)
+
+	def _trigger(self, scope, settings) -> Optional[str]:
+		if settings.profiling_token:
+			for name, value in scope.get("headers", ()):
+				if name == PROFILE_HEADER:
+					if hmac.compare_digest(value.decode("latin-1"), settings.profiling_token):
+						return "header"
+					break
+		if settings.profiling_sample_rate > 0 and random.random() < settings.profiling_sample_rate:
+			return "sample"
+		return None
+
+	def _save(self, directory: str, profile_id: str, profiler, scope, status_code, duration: float, trigger: str):
+		os.makedirs(directory, exist_ok=True)
+		route = scope.get("route")
+		route_path = getattr(route, "path", None) or scope["path"]
+		name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{re.sub(r'[^A-Za-z0-9]+', '_', route_path).strip('_') or 'root'}-{profile_id[:8]}"
+
+		if SamplingProfiler:
+			profile_file = f"{name}.html"
+			with open(os.path.join(directory, profile_file), "w") as f:
+				f.write(profiler.output_html())
+		else:
+			profile_file = f"{name}.pstats"
+			profiler.dump_stats(os.path.join(directory, profile_file))
+
+		metadata = {
+			"id": profile_id,
+			"method": scope["method"],
+			"route": route_path,
+			"path": scope["path"],
+			"query_string": scope.get("query_string", b"").decode("latin-1"),
+			"status": status_code,
+			"duration_ms": round(duration * 1000, 3),
+			"trigger": trigger,
+			"profiler": "pyinstrument" if SamplingProfiler else "cProfile",
+			"profile_file": profile_file,
+			"warning": None if SamplingProfiler else CPROFILE_WARNING,
+			"created_at": datetime.now(timezone.utc).isoformat(),
+		}
+		with open(os.path.join(directory, f"{name}.json"), "w") as f:
+			json.dump(metadata, f, indent=2)
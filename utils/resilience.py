@@ -0,0 +1,163 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Optional
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# A backend did not answer in time or is refusing calls. Mapped to an HTTP
+# error by the handler in main.py.
+class BackendUnavailable(Exception):
+	status_code = 503
+
+	def __init__(self, backend: str, message: str, retry_after: Optional[float] = None):
+		super().__init__(message)
+		self.backend = backend
+		self.retry_after = retry_after
+
+class CircuitOpenError(BackendUnavailable):
+	def __init__(self, backend: str, retry_after: float):
+		super().__init__(backend, f"{backend} is unavailable, retry in {retry_after:.0f}s", retry_after)
+
+# Stops calling a failing backend for a while.
+#
+# The breaker is closed while calls succeed. After `failure_threshold`
+# consecutive failures it opens: calls are refused with CircuitOpenError for
+# `reset_timeout` seconds, instead of each one waiting for its own timeout.
+# Then a single trial call is let through (half-open), its success closes the
+# breaker and its failure opens it again.
+class CircuitBreaker:
+	def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+		self.name = name
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.state = "closed"
+		self._failures = 0
+		self._opened_at = 0.0
+		self._trial = False
+		self._lock = Lock()
+
+	def configure(self, failure_threshold: int, reset_timeout: float):
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+
+	# Whether a call may go out now. In half-open state only the first caller
+	# gets to make the trial call.
+	def allow(self) -> bool:
+		with self._lock:
+			if self.state == "closed":
+				return True
+			if self.state == "open":
+				if time.monotonic() - self._opened_at < self.reset_timeout:
+					return False
+				self.state = "half-open"
+				self._trial = False
+			if self._trial:
+				return False
+			self._trial = True
+			return True
+
+	# Whether calls are currently refused, without claiming the trial call
+	@property
+	def is_open(self) -> bool:
+		with self._lock:
+			if self.state == "open":
+				return time.monotonic() - self._opened_at < self.reset_timeout
+			return self.state == "half-open" and self._trial
+
+	def retry_after(self) -> float:
+		return max(self.reset_timeout - (time.monotonic() - self._opened_at), 1.0)
+
+	def check(self):
+		if not self.allow():
+			raise CircuitOpenError(self.name, self.retry_after())
+
+	def record_success(self):
+		with self._lock:
+			if self.state != "closed":
+				logger.info("Circuit breaker for %s closed", self.name)
+			self.state = "closed"
+			self._failures = 0
+			self._trial = False
+
+	def record_failure(self):
+		with self._lock:
+			self._failures += 1
+			if self.state == "half-open" or self._failures >= self.failure_threshold:
+				if self.state != "open":
+					logger.warning("Circuit breaker for %s opened after %d failures", self.name, self._failures)
+				self.state = "open"
+				self._opened_at = time.monotonic()
+				self._trial = False
+
+	# Call fn through the breaker. Exceptions for which is_failure returns
+	# False (a rejected request, not an outage) count as successes.
+	def call(self, fn: Callable, *args, is_failure: Callable[[Exception], bool] = lambda e: True, **kwargs):
+		self.check()
+		try:
+			result = fn(*args, **kwargs)
+		except Exception as e:
+			if is_failure(e):
+				self.record_failure()
+			else:
+				self.record_success()
+			raise
+		self.record_success()
+		return result
+
+# One breaker per backend, the Supabase replicas get their own in utils/database.py
+supabase_breaker = CircuitBreaker("supabase")
+cloudinary_breaker = CircuitBreaker("cloudinary")
+
+# Backends that served a cached response during the current request
+_stale_backends: ContextVar[Optional[set]] = ContextVar("stale_backends", default=None)
+
+# Record that the current request is answered with stale data from backend
+def mark_stale(backend: str):
+	backends = _stale_backends.get()
+	if backends is not None:
+		backends.add(backend)
+
+# Set while bulk reads that are never repeated run (export pages, id
+# preloads, follow graph reloads), so their responses don't push useful
+# entries out of the stale cache and they are not hedged
+_skip_stale_cache: ContextVar[bool] = ContextVar("skip_stale_cache", default=False)
+
+@contextmanager
+def uncached_reads():
+	token = _skip_stale_cache.set(True)
+	try:
+		yield
+	finally:
+		_skip_stale_cache.reset(token)
+
+def stale_cache_skipped() -> bool:
+	return _skip_stale_cache.get()
+
+# ASGI middleware adding a Warning: 110 header to responses built from
+# cached backend responses, served while a backend is unavailable
+class StaleResponseMiddleware:
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			return await self.app(scope, receive, send)
+		backends = set()
+		token = _stale_backends.set(backends)
+
+		async def send_wrapper(message):
+			if message["type"] == "http.response.start" and backends:
+				message["headers"] = [
+					*message.get("headers", []),
+					(b"warning", b'110 - "Response is Stale"'),
+					(b"x-stale-backends", ", ".join(sorted(backends)).encode()),
+				]
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			_stale_backends.reset(token)
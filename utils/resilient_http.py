@@ -0,0 +1,233 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from threading import Lock
+from typing import Optional
+from utils.resilience import BackendUnavailable, CircuitBreaker, CircuitOpenError, mark_stale, stale_cache_skipped
+import httpx
+import time
+
+# Reads are sent again only when idempotent
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
+# Request headers changing the response, part of the stale cache key
+VARYING_HEADERS = ("accept", "accept-profile", "prefer", "range", "authorization")
+
+# Responses larger than this are not kept for stale reads
+MAX_STALE_BYTES = 64 * 1024
+
+# Latency windows per transport, one per request path (table, RPC or auth
+# endpoint). Paths beyond this are not hedged.
+MAX_LATENCY_WINDOWS = 200
+
+class DeadlineExceeded(httpx.TimeoutException, BackendUnavailable):
+	status_code = 504
+
+	def __init__(self, backend: str, deadline: float, request: httpx.Request):
+		# Both bases chain their __init__, set their attributes directly
+		Exception.__init__(self, f"{backend} did not answer within {deadline:g}s")
+		self.request = request
+		self.backend = backend
+		self.retry_after = None
+
+# Durations of the most recent successful reads
+class LatencyWindow:
+	def __init__(self, size: int = 1000, min_samples: int = 50):
+		self.min_samples = min_samples
+		self._samples = deque(maxlen=size)
+		self._lock = Lock()
+
+	def add(self, seconds: float):
+		with self._lock:
+			self._samples.append(seconds)
+
+	# The percentile-th duration in seconds, None until min_samples are known
+	def percentile(self, percentile: float) -> Optional[float]:
+		with self._lock:
+			if len(self._samples) < self.min_samples:
+				return None
+			samples = sorted(self._samples)
+		return samples[min(int(len(samples) * percentile / 100), len(samples) - 1)]
+
+# Last successful response of each read, least recently stored evicted first
+# once max_entries responses or max_bytes of bodies are kept. Keys leave out
+# the host so the primary and its replicas share entries.
+class StaleCache:
+	def __init__(self, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024):
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self._entries: OrderedDict[tuple, tuple[int, httpx.Headers, bytes]] = OrderedDict()
+		self._bytes = 0
+		self._lock = Lock()
+
+	@staticmethod
+	def key(request: httpx.Request) -> tuple:
+		return (request.method, request.url.raw_path, *(request.headers.get(name) for name in VARYING_HEADERS))
+
+	def get(self, request: httpx.Request) -> Optional[tuple[int, httpx.Headers, bytes]]:
+		with self._lock:
+			return self._entries.get(self.key(request))
+
+	def put(self, request: httpx.Request, status: int, headers: httpx.Headers, content: bytes):
+		if len(content) > min(MAX_STALE_BYTES, self.max_bytes):
+			return
+		key = self.key(request)
+		with self._lock:
+			replaced = self._entries.pop(key, None)
+			if replaced is not None:
+				self._bytes -= len(replaced[2])
+			self._entries[key] = (status, headers, content)
+			self._bytes += len(content)
+			while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+				_, (_, _, evicted) = self._entries.popitem(last=False)
+				self._bytes -= len(evicted)
+
+# httpx transport giving every call to one backend a deadline, hedging slow
+# reads and going through the backend's circuit breaker.
+#
+# Reads (GET and HEAD) must finish within `deadline` seconds, body included.
+# A read still unanswered after the `hedge_percentile` latency of recent reads
+# of the same path is sent a second time and the first response wins, so
+# heavier tables and RPCs are measured against themselves. Bulk reads made in
+# uncached_reads() are never hedged. Writes are sent once, bounded by the
+# client's timeouts. Timeouts, connection errors and 5xx
+# responses count as failures of the breaker. While it is open, or when a
+# read fails, the last successful response to the same read is served from
+# stale_cache and the request is marked stale (see StaleResponseMiddleware).
+class ResilientTransport(httpx.BaseTransport):
+	def __init__(self, breaker: CircuitBreaker, deadline: float, hedge_percentile: float = 95.0,
+			stale_cache: Optional[StaleCache] = None, transport: Optional[httpx.BaseTransport] = None,
+			max_workers: int = 32):
+		self.breaker = breaker
+		self.deadline = deadline
+		self.hedge_percentile = hedge_percentile
+		self.stale_cache = stale_cache
+		self._transport = transport or httpx.HTTPTransport(http2=True)
+		self._latency: dict[str, LatencyWindow] = {}
+		self._latency_lock = Lock()
+		self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{breaker.name}-read")
+		self.hedged = 0
+
+	def handle_request(self, request: httpx.Request) -> httpx.Response:
+		read = request.method in IDEMPOTENT_METHODS
+		if not self.breaker.allow():
+			stale = self._serve_stale(request) if read else None
+			if stale is None:
+				raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+			return stale
+
+		try:
+			if read:
+				status, headers, content = self._read(request)
+			else:
+				response = self._transport.handle_request(request)
+		except Exception as e:
+			self.breaker.record_failure()
+			stale = self._serve_stale(request) if read else None
+			if stale is not None:
+				return stale
+			if isinstance(e, httpx.TimeoutException):
+				raise DeadlineExceeded(self.breaker.name, self.deadline, request) from e
+			raise
+
+		if not read:
+			if response.status_code >= 500:
+				self.breaker.record_failure()
+			else:
+				self.breaker.record_success()
+			return response
+
+		if status >= 500:
+			self.breaker.record_failure()
+			stale = self._serve_stale(request)
+			if stale is not None:
+				return stale
+		else:
+			self.breaker.record_success()
+			if self.stale_cache is not None and 200 <= status < 300 and not stale_cache_skipped():
+				self.stale_cache.put(request, status, headers, content)
+		return httpx.Response(status, headers=headers, stream=httpx.ByteStream(content))
+
+	# Send a read, and a hedge if it is slow, returning the first answer that
+	# is not a server error
+	def _read(self, request: httpx.Request) -> tuple[int, httpx.Headers, bytes]:
+		started = time.monotonic()
+		attempts = {self._executor.submit(self._fetch, request)}
+		# No hedging while the breaker probes a recovering backend
+		delay = None
+		if self.hedge_percentile and self.breaker.state == "closed" and not stale_cache_skipped():
+			latency = self._latency_of(request)
+			delay = latency.percentile(self.hedge_percentile) if latency else None
+		if delay is not None and delay < self.deadline:
+			done, _ = wait(attempts, timeout=delay)
+			if not done:
+				self.hedged += 1
+				hedge = httpx.Request(request.method, request.url, headers=request.headers, extensions=request.extensions)
+				attempts.add(self._executor.submit(self._fetch, hedge))
+
+		result = None
+		error = None
+		pending = attempts
+		while pending:
+			remaining = self.deadline - (time.monotonic() - started)
+			done, pending = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+			if not done:
+				raise httpx.ReadTimeout(f"No response within {self.deadline:g}s", request=request)
+			for attempt in done:
+				try:
+					result = attempt.result()
+				except Exception as e:
+					error = e
+					continue
+				if result[0] < 500:
+					return result
+		if result is not None:
+			return result
+		raise error
+
+	def _fetch(self, request: httpx.Request) -> tuple[int, httpx.Headers, bytes]:
+		started = time.monotonic()
+		response = self._transport.handle_request(request)
+		try:
+			# Raw bytes, the client decodes them as for any other response
+			content = b"".join(response.stream)
+		finally:
+			response.close()
+		if response.status_code < 500:
+			latency = self._latency_of(request)
+			if latency:
+				latency.add(time.monotonic() - started)
+		return response.status_code, response.headers, content
+
+	# The latency window of the request's path, None once MAX_LATENCY_WINDOWS
+	# other paths are tracked
+	def _latency_of(self, request: httpx.Request) -> Optional[LatencyWindow]:
+		path = request.url.path
+		with self._latency_lock:
+			latency = self._latency.get(path)
+			if latency is None and len(self._latency) < MAX_LATENCY_WINDOWS:
+				latency = self._latency[path] = LatencyWindow()
+			return latency
+
+	def _serve_stale(self, request: httpx.Request) -> Optional[httpx.Response]:
+		if self.stale_cache is None:
+			return None
+		entry = self.stale_cache.get(request)
+		if entry is None:
+			return None
+		mark_stale(self.breaker.name)
+		status, headers, content = entry
+		return httpx.Response(status, headers=headers, stream=httpx.ByteStream(content))
+
+	def close(self):
+		self._executor.shutdown(wait=False)
+		self._transport.close()
+
+# An httpx client for supabase-py going through a ResilientTransport. Its
+# timeouts bound each phase of a write, reads are bounded by the deadline.
+def resilient_client(breaker: CircuitBreaker, deadline: float, hedge_percentile: float,
+		stale_cache: Optional[StaleCache]) -> httpx.Client:
+	return httpx.Client(
+		transport=ResilientTransport(breaker, deadline, hedge_percentile, stale_cache),
+		timeout=deadline,
+		follow_redirects=True,
+	)
@@ -0,0 +1,93 @@
+from models.Tweet import TweetResponse
+from models.User import UserBase
+
+# Computed fields of TweetResponse that can be selected with `fields`
+TWEET_FIELDS = frozenset({"likes_count", "retweet_count", "reply_to", "is_liked", "view_count"})
+
+# Build TweetResponse objects for tweet rows selected with TWEET_COLUMNS.
+# Only the computed fields in `fields` are fetched, for the whole page at once:
+# the counts in one call, without downloading the counted rows, the reply
+# targets and view counts in one query each.
+# is_liked is False here, apply_viewer_likes sets it for a viewer.
+def hydrate_tweets(supabase, rows, fields: frozenset = TWEET_FIELDS) -> list[TweetResponse]:
+	reply_to_by_id = {}
+	parent_ids = list({row["retweet_id"] for row in rows if row.get("retweet_id")})
+	if "reply_to" in fields and parent_ids:
+		parents_response = supabase \
+			.from_("tweets") \
+			.select("id, users(email)") \
+			.in_("id", parent_ids) \
+			.execute()
+		reply_to_by_id = {parent["id"]: parent["users"]["email"] for parent in parents_response.data}
+
+	counts_by_id = {}
+	if ("likes_count" in fields or "retweet_count" in fields) and rows:
+		# Called with GET as a read-only query, so it can be hedged and served
+		# stale like the other reads. The ids go as an array literal.
+		tweet_ids = "{" + ",".join(tweet["id"] for tweet in rows) + "}"
+		counts_response = supabase.rpc("tweet_counts", {"tweet_ids": tweet_ids}, get=True).execute()
+		counts_by_id = {counts["id"]: counts for counts in counts_response.data}
+
+	view_counts = {}
+	if "view_count" in fields and rows:
+		views_response = supabase \
+			.from_("tweet_views") \
+			.select("tweet_id, view_count") \
+			.in_("tweet_id", [tweet["id"] for tweet in rows]) \
+			.execute()
+		view_counts = {views["tweet_id"]: views["view_count"] for views in views_response.data}
+
+	tweets = []
+	for tweet in rows:
+		computed = {}
+		counts = counts_by_id.get(tweet["id"], {})
+		if "likes_count" in fields:
+			computed["likes_count"] = counts.get("likes_count", 0)
+
+		if "retweet_count" in fields:
+			computed["retweet_count"] = counts.get("retweet_count", 0)
+
+		if "reply_to" in fields:
+			computed["reply_to"] = reply_to_by_id.get(tweet.get("retweet_id"))
+
+		if "is_liked" in fields:
+			computed["is_liked"] = False
+
+		if "view_count" in fields:
+			computed["view_count"] = view_counts.get(tweet["id"], 0)
+
+		user = tweet["users"]
+		tweets.append(TweetResponse(
+			id=tweet["id"],
+			content=tweet["content"],
+			user_id=tweet["user_id"],
+			retweet_id=tweet.get("retweet_id"),
+			image_url=tweet.get("image_url"),
+			created_at=tweet["created_at"],
+			user=UserBase(
+				id=user["id"],
+				username=user["username"],
+				email=user["email"],
+				profile_image_url=user["profile_image_url"]
+			),
+			**computed
+		))
+	return tweets
+
+# Set is_liked for the viewer on already hydrated tweets with a single query
+def apply_viewer_likes(supabase, tweets: list[TweetResponse], viewer_id, fields: frozenset = TWEET_FIELDS) -> list[TweetResponse]:
+	if not viewer_id or not tweets or "is_liked" not in fields:
+		return tweets
+
+	liked_response = supabase \
+		.from_("tweet_likes") \
+		.select("tweet_id") \
+		.eq("user_id", str(viewer_id)) \
+		.in_("tweet_id", [str(tweet.id) for tweet in tweets]) \
+		.execute()
+	liked_ids = {like["tweet_id"] for like in liked_response.data}
+
+	return [
+		tweet.model_copy(update={"is_liked": True}) if str(tweet.id) in liked_ids else tweet
+		for tweet in tweets
+	]
@@ -0,0 +1,89 @@
+from models.User import UserResponse
+from utils.columns import PROFILE_CARD_COLUMNS
+
+# Computed fields of UserResponse that can be selected with `fields`
+USER_FIELDS = frozenset({"tweet_count", "follower_count", "following_count", "is_followed"})
+
+# Embedded aggregates computing each count field, grouped by the users.id they
+# are embedded in. user_followers references users twice, so its embeds name
+# the foreign key to count through.
+COUNT_EMBEDS = {
+	"tweet_count": "tweet_count:tweets(count)",
+	"follower_count": "follower_count:user_followers!user_followers_user_id_fkey(count)",
+	"following_count": "following_count:user_followers!user_followers_follower_id_fkey(count)",
+}
+
+# Fetch the requested counts for many users in one query, keyed by user id
+def fetch_user_counts(supabase, user_ids: list, fields: frozenset = USER_FIELDS) -> dict[str, dict]:
+	embeds = [embed for field, embed in COUNT_EMBEDS.items() if field in fields]
+	if not embeds or not user_ids:
+		return {}
+
+	counts_response = supabase \
+		.from_("users") \
+		.select(", ".join(["id", *embeds])) \
+		.in_("id", user_ids) \
+		.execute()
+
+	return {
+		row["id"]: {field: row[field][0]["count"] if row[field] else 0 for field in COUNT_EMBEDS if field in row}
+		for row in counts_response.data
+	}
+
+# Ids among user_ids that the viewer follows, in one query
+def fetch_followed_ids(supabase, viewer_id, user_ids: list) -> set[str]:
+	if not viewer_id or not user_ids:
+		return set()
+
+	followed_response = supabase \
+		.from_("user_followers") \
+		.select("user_id") \
+		.eq("follower_id", str(viewer_id)) \
+		.in_("user_id", user_ids) \
+		.execute()
+	return {row["user_id"] for row in followed_response.data}
+
+# Build UserResponse objects for user rows selected with PROFILE_CARD_COLUMNS.
+# Only the computed fields in `fields` are fetched, for the whole list at once:
+# one query for the counts and one for is_followed when a viewer is given.
+def hydrate_users(supabase, rows, viewer_id=None, fields: frozenset = USER_FIELDS) -> list[UserResponse]:
+	user_ids = [user["id"] for user in rows]
+	counts_by_id = fetch_user_counts(supabase, user_ids, fields)
+
+	followed_ids = None
+	if "is_followed" in fields and viewer_id:
+		followed_ids = fetch_followed_ids(supabase, viewer_id, user_ids)
+
+	users = []
+	for user in rows:
+		computed = dict(counts_by_id.get(user["id"], {}))
+		if followed_ids is not None:
+			computed["is_followed"] = user["id"] in followed_ids
+
+		users.append(UserResponse(
+			id=user["id"],
+			email=user["email"],
+			username=user["username"],
+			bio=user["bio"],
+			profile_image_url=user["profile_image_url"],
+			background_image_url=user["background_image_url"],
+			created_at=user["created_at"],
+			**computed
+		))
+	return users
+
+# Fetch and hydrate the given users with one query for the rows, keeping the
+# order of user_ids. Ids without a user row are skipped.
+def fetch_users_in_order(supabase, user_ids: list, fields: frozenset = USER_FIELDS, viewer_id=None) -> list[UserResponse]:
+	if not user_ids:
+		return []
+
+	users_response = supabase \
+		.table("users") \
+		.select(PROFILE_CARD_COLUMNS) \
+		.in_("id", user_ids) \
+		.execute()
+	users_by_id = {user["id"]: user for user in users_response.data}
+
+	rows = [users_by_id[user_id] for user_id in user_ids if user_id in users_by_id]
+	return hydrate_users(supabase, rows, viewer_id=viewer_id, fields=fields)
@@ -0,0 +1,79 @@
+from fastapi.concurrency import run_in_threadpool
+from threading import Lock
+from utils.database import get_supabase
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Write-behind buffer of tweet views.
+#
+# Handlers call record() with the tweets they return, which only adds to an
+# in-memory count per tweet. run() writes the counts every `interval` seconds,
+# or as soon as `max_tweets` tweets have pending views, `batch_size` tweets
+# per add_tweet_views call (see supabase/migrations). Views of further tweets
+# are dropped while the buffer is full, and counts that failed to be written
+# are kept for the next flush if there is room.
+class ViewCounter:
+	def __init__(self, interval: float = 10.0, max_tweets: int = 10000, batch_size: int = 1000):
+		# Views are ignored until configure() is called, when view counts are enabled
+		self.enabled = False
+		self.interval = interval
+		self.max_tweets = max_tweets
+		self.batch_size = batch_size
+		self._counts: dict[str, int] = {}
+		self._lock = Lock()
+		self._full = asyncio.Event()
+		self.dropped = 0
+
+	def configure(self, interval: float, max_tweets: int):
+		self.enabled = True
+		self.interval = interval
+		self.max_tweets = max_tweets
+
+	def record(self, *tweet_ids):
+		if not self.enabled:
+			return
+		with self._lock:
+			self._add({str(tweet_id): 1 for tweet_id in tweet_ids})
+			if len(self._counts) >= self.max_tweets:
+				self._full.set()
+
+	def _add(self, counts: dict[str, int]):
+		for tweet_id, count in counts.items():
+			if tweet_id in self._counts:
+				self._counts[tweet_id] += count
+			elif len(self._counts) < self.max_tweets:
+				self._counts[tweet_id] = count
+			else:
+				self.dropped += count
+
+	def flush(self):
+		with self._lock:
+			counts, self._counts = self._counts, {}
+			self._full.clear()
+		views = [{"tweet_id": tweet_id, "count": count} for tweet_id, count in counts.items()]
+		for start in range(0, len(views), self.batch_size):
+			batch = views[start:start + self.batch_size]
+			try:
+				get_supabase().rpc("add_tweet_views", {"views": batch}).execute()
+			except Exception:
+				logger.exception("Failed to write the views of %d tweets", len(batch))
+				with self._lock:
+					self._add({view["tweet_id"]: view["count"] for view in batch})
+		if self.dropped:
+			logger.warning("Dropped %d tweet views, the buffer was full", self.dropped)
+			self.dropped = 0
+
+	async def run(self):
+		while True:
+			try:
+				await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+			except asyncio.TimeoutError:
+				pass
+			try:
+				await run_in_threadpool(self.flush)
+			except Exception:
+				logger.exception("Failed to flush tweet views")
+
+view_counter = ViewCounter()